@@ -0,0 +1,8 @@
+# -*- coding: utf-8 -*-
+
+# FOGLAMP_BEGIN
+# See: http://foglamp.readthedocs.io/
+# FOGLAMP_END
+
+"""Performance benchmarks. Run each module with ``python -m benchmarks.<module>``
+from src/python."""
@@ -0,0 +1,188 @@
+# -*- coding: utf-8 -*-
+
+# FOGLAMP_BEGIN
+# See: http://foglamp.readthedocs.io/
+# FOGLAMP_END
+
+"""Measures how fast the CoAP sensor-values resource ingests readings
+
+A synthetic fleet of devices posts CBOR payloads to
+:class:`foglamp.device.coap.sensor_values.SensorValues` through the
+same Ingest pipeline the device service uses. Readings are inserted
+into PostgreSQL when --connection-string is given and into a storage
+stub otherwise, which isolates the cost of the Python ingest path.
+
+Reports readings/s, p50/p99 latency of each post and CPU time of this
+process per reading.
+
+Usage:
+    python -m benchmarks.ingest_throughput [--devices N] [--rate N] [--duration S]
+        [--readings-per-message N] [--sensor-values N] [--connection-string DSN]
+"""
+
+import argparse
+import asyncio
+import collections
+import time
+import uuid
+
+import aiocoap
+from cbor2 import dumps
+
+from foglamp.device.coap.sensor_values import SensorValues
+from foglamp.device.ingest import Ingest
+from foglamp.storage_pool import StoragePool
+
+__author__    = "Terris Linenbach"
+__copyright__ = "Copyright (c) 2017 OSIsoft, LLC"
+__license__   = "Apache 2.0"
+__version__   = "${VERSION}"
+
+
+_Result = collections.namedtuple('_Result', 'rowcount')
+
+
+class _StubStoragePool(object):
+    """Accepts every statement after latency seconds"""
+
+    class _Connection(object):
+        def __init__(self, latency):
+            self._latency = latency
+
+        async def execute(self, statement):
+            if self._latency:
+                await asyncio.sleep(self._latency)
+            rows = statement.parameters
+            return _Result(len(rows) if isinstance(rows, list) else 1)
+
+    class _AcquireContextManager(object):
+        def __init__(self, latency):
+            self._latency = latency
+
+        async def __aenter__(self):
+            return _StubStoragePool._Connection(self._latency)
+
+        async def __aexit__(self, exc_type, exc_val, exc_tb):
+            pass
+
+    def __init__(self, latency=0.0):
+        self._latency = latency
+
+    async def start(self):
+        pass
+
+    async def stop(self):
+        pass
+
+    def acquire(self):
+        return self._AcquireContextManager(self._latency)
+
+
+def _payload(device, sequence, readings_per_message, sensor_values):
+    readings = [{'timestamp': '2017-01-02T01:02:03.23232Z-05:00',
+                 'asset': 'device{}'.format(device),
+                 'key': str(uuid.uuid4()),
+                 'sensor_values': {'value{}'.format(i): sequence + i for i in range(sensor_values)}}
+                for _ in range(readings_per_message)]
+    return dumps(readings if readings_per_message > 1 else readings[0])
+
+
+async def _device(resource, device, args, end_time, latencies, codes):
+    interval = 1 / args.rate if args.rate else 0
+    sequence = 0
+    next_time = time.monotonic()
+
+    while time.monotonic() < end_time:
+        request = aiocoap.Message(code=aiocoap.numbers.codes.Code.POST,
+                                  payload=_payload(device, sequence, args.readings_per_message,
+                                                   args.sensor_values))
+        start_time = time.monotonic()
+        response = await resource.render_post(request)
+        latencies.append(time.monotonic() - start_time)
+        codes[str(response.code)] += 1
+        sequence += 1
+
+        if interval:
+            next_time += interval
+            delay = next_time - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+        else:
+            # Let the other devices and the ingest task run
+            await asyncio.sleep(0)
+
+
+def _percentile(sorted_values, percent):
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * percent / 100))]
+
+
+async def _run(args):
+    if args.connection_string:
+        storage_pool = StoragePool(min_size=args.pool_size, max_size=args.pool_size,
+                                   connection_string=args.connection_string)
+    else:
+        storage_pool = _StubStoragePool(args.stub_latency / 1000)
+    await storage_pool.start()
+
+    ingest = Ingest(storage_pool, max_batch_size=args.batch_size, max_batch_wait_ms=args.batch_wait,
+                    max_buffered=args.max_buffered)
+    ingest.start()
+    resource = SensorValues(ingest)
+
+    latencies = []
+    codes = collections.Counter()
+    end_time = time.monotonic() + args.duration
+
+    start_cpu = time.process_time()
+    start_time = time.monotonic()
+    await asyncio.gather(*[_device(resource, device, args, end_time, latencies, codes)
+                           for device in range(args.devices)])
+    await ingest.stop()
+    elapsed = time.monotonic() - start_time
+    cpu = time.process_time() - start_cpu
+
+    statistics = ingest.get_statistics()
+    await storage_pool.stop()
+
+    return elapsed, cpu, sorted(latencies), codes, statistics
+
+
+def main():
+    """Processes command-line arguments and runs the benchmark"""
+    parser = argparse.ArgumentParser(prog='python -m benchmarks.ingest_throughput',
+                                     description='Drives the CoAP sensor-values resource with synthetic devices')
+    parser.add_argument('--devices', type=int, default=100)
+    parser.add_argument('--rate', type=float, default=0,
+                        help='messages/s per device (0: as fast as possible)')
+    parser.add_argument('--duration', type=float, default=10, help='seconds')
+    parser.add_argument('--readings-per-message', type=int, default=1,
+                        help='more than 1 posts arrays of readings')
+    parser.add_argument('--sensor-values', type=int, default=3, help='values per reading')
+    parser.add_argument('--batch-size', type=int, default=100)
+    parser.add_argument('--batch-wait', type=int, default=50, help='milliseconds')
+    parser.add_argument('--max-buffered', type=int, default=5000)
+    parser.add_argument('--pool-size', type=int, default=10)
+    parser.add_argument('--stub-latency', type=float, default=1,
+                        help='milliseconds per statement when no database is used')
+    parser.add_argument('--connection-string',
+                        help='insert into this PostgreSQL database instead of the stub')
+    args = parser.parse_args()
+
+    elapsed, cpu, latencies, codes, statistics = asyncio.get_event_loop().run_until_complete(_run(args))
+
+    readings = statistics['readings_inserted'] + statistics['duplicates_dropped']
+    print("Storage:            {}".format('PostgreSQL' if args.connection_string else 'stub'))
+    print("Messages:           {} ({:.0f}/s)".format(len(latencies), len(latencies) / elapsed))
+    print("Readings:           {} ({:.0f}/s)".format(readings, readings / elapsed))
+    print("Latency p50/p99:    {:.2f} / {:.2f} ms".format(
+        _percentile(latencies, 50) * 1000, _percentile(latencies, 99) * 1000))
+    print("CPU per reading:    {:.1f} us".format(cpu / readings * 1e6 if readings else 0))
+    print("Response codes:     {}".format(dict(codes)))
+    print("Batches:            {} (avg insert {:.2f} ms)".format(
+        statistics['batches_inserted'], statistics['insert_seconds_avg'] * 1000))
+
+
+if __name__ == '__main__':
+    main()
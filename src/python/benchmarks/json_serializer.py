@@ -0,0 +1,68 @@
+# -*- coding: utf-8 -*-
+
+# FOGLAMP_BEGIN
+# See: http://foglamp.readthedocs.io/
+# FOGLAMP_END
+
+"""Measures foglamp.json_serializer against the standard json module
+
+Times the three JSON operations of the OMF translator on synthetic
+readings: decoding the reading column, encoding the values of each row
+and encoding whole Data messages.
+
+Usage:
+    python -m benchmarks.json_serializer [--rows N]
+"""
+
+import argparse
+import json
+import time
+
+from foglamp import json_serializer
+
+__author__    = "Terris Linenbach"
+__copyright__ = "Copyright (c) 2017 OSIsoft, LLC"
+__license__   = "Apache 2.0"
+__version__   = "${VERSION}"
+
+
+def _readings(count):
+    return [{"x": 1.2 + i, "y": 0.3, "z": -9.8, "humidity": 43.1, "temperature": 21.5 + i % 10}
+            for i in range(count)]
+
+
+def _operations_per_second(function, arguments):
+    start_time = time.perf_counter()
+    for argument in arguments:
+        function(argument)
+    return len(arguments) / (time.perf_counter() - start_time)
+
+
+def main():
+    """Processes command-line arguments and runs the benchmark"""
+    parser = argparse.ArgumentParser(prog='python -m benchmarks.json_serializer',
+                                     description='Compares JSON libraries on OMF translator payloads')
+    parser.add_argument('--rows', type=int, default=200000)
+    args = parser.parse_args()
+
+    readings = _readings(args.rows)
+    columns = [json.dumps(reading) for reading in readings]
+    values = [dict(reading, Time='2017-01-01T00:00:00.{:06d}'.format(i % 1000000))
+              for i, reading in enumerate(readings)]
+    messages = [[{"containerid": "measurement_{}".format(i), "values": values[i:i + 500]}]
+                for i in range(0, len(values), 500)]
+
+    print("Library:            {}".format(json_serializer.library()))
+    print("{:<22}{:>14}{:>14}{:>8}".format('operation', 'json/s', 'library/s', 'gain'))
+
+    for name, json_function, library_function, arguments in (
+            ('decode readings', json.loads, json_serializer.loads, columns),
+            ('encode values', json.dumps, json_serializer.dumps, values),
+            ('encode messages', json.dumps, json_serializer.dumps, messages)):
+        before = _operations_per_second(json_function, arguments)
+        after = _operations_per_second(library_function, arguments)
+        print("{:<22}{:>14.0f}{:>14.0f}{:>7.1f}x".format(name, before, after, after / before))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,96 @@
+# -*- coding: utf-8 -*-
+
+# FOGLAMP_BEGIN
+# See: http://foglamp.readthedocs.io/
+# FOGLAMP_END
+
+"""Measures what compressing OMF Data messages saves on a slow uplink
+
+Builds the Data messages of a synthetic block of TI sensorTag and
+mouse readings the way omf_translator does and compresses them at each
+level. For every level it reports the size of the bodies, the CPU time
+spent compressing and the readings/s an uplink of --uplink kbit/s could
+carry.
+
+Usage:
+    python -m benchmarks.omf_compression [--rows N] [--uplink KBITS] [--compression gzip|deflate]
+"""
+
+import argparse
+import collections
+import datetime
+import time
+
+from foglamp import json_serializer
+from foglamp.translators import omf_translator
+
+__author__    = "Terris Linenbach"
+__copyright__ = "Copyright (c) 2017 OSIsoft, LLC"
+__license__   = "Apache 2.0"
+__version__   = "${VERSION}"
+
+_READINGS = {
+    "TI sensorTag/accelerometer": {"x": 1.2, "y": 0.3, "z": -9.8},
+    "TI sensorTag/humidity": {"humidity": 43.1, "temperature": 21.5},
+    "TI sensorTag/luxometer": {"lux": 320},
+    "TI sensorTag/pressure": {"pressure": 1013},
+    "TI sensorTag/temperature": {"object": 30.2, "ambient": 21.9},
+    "TI sensorTag/keys": {"left": "up", "right": "down", "magnet": "up"},
+    "mouse": {"button": "down"}
+}
+
+_Row = collections.namedtuple('_Row', 'id asset_code user_ts reading')
+
+
+def _messages(count):
+    """Returns the Data messages of count readings, as send_block builds them"""
+    asset_codes = list(_READINGS)
+    start_ts = datetime.datetime(2017, 1, 1)
+    container_values = collections.OrderedDict()
+
+    for i in range(count):
+        asset_code = asset_codes[i % len(asset_codes)]
+        reading = {key: value if isinstance(value, str) else value + i % 100
+                   for key, value in _READINGS[asset_code].items()}
+        row = _Row(i, asset_code, start_ts + datetime.timedelta(milliseconds=i * 10), reading)
+        values = omf_translator._omf_value_extractors[omf_translator._sensor_name_type[asset_code]](row)
+        container_values.setdefault("measurement_" + asset_code, []).append(json_serializer.dumps(values))
+
+    return omf_translator.create_data_messages(container_values, omf_translator._max_message_size)
+
+
+def main():
+    """Processes command-line arguments and runs the benchmark"""
+    parser = argparse.ArgumentParser(prog='python -m benchmarks.omf_compression',
+                                     description='Compresses OMF Data messages at each level')
+    parser.add_argument('--rows', type=int, default=5000, help='readings in the block')
+    parser.add_argument('--uplink', type=float, default=1000, help='kbit/s')
+    parser.add_argument('--compression', choices=['gzip', 'deflate'], default='gzip')
+    args = parser.parse_args()
+
+    omf_translator.initialize_plugin()
+    messages = _messages(args.rows)
+    bytes_per_second = args.uplink * 1000 / 8
+
+    print("Readings:           {} in {} messages".format(args.rows, len(messages)))
+    print("{:<10}{:>12}{:>8}{:>16}{:>16}".format('level', 'bytes', 'ratio', 'compress ms', 'readings/s'))
+
+    raw_size = sum(len(message.encode("utf-8")) for message in messages)
+    print("{:<10}{:>12}{:>8.2f}{:>16.2f}{:>16.0f}".format(
+        'none', raw_size, 1, 0, args.rows / (raw_size / bytes_per_second)))
+
+    omf_translator._compression = args.compression
+    for level in range(1, 10):
+        omf_translator._compression_level = level
+
+        start_time = time.process_time()
+        size = sum(len(omf_translator.compress_omf_message(message)[0]) for message in messages)
+        cpu = time.process_time() - start_time
+
+        seconds = cpu + size / bytes_per_second
+        print("{:<10}{:>12}{:>8.2f}{:>16.2f}{:>16.0f}".format(
+            level, size, raw_size / size, cpu * 1000, args.rows / seconds))
+
+
+if __name__ == '__main__':
+    main()
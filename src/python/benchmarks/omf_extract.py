@@ -0,0 +1,96 @@
+# -*- coding: utf-8 -*-
+
+# FOGLAMP_BEGIN
+# See: http://foglamp.readthedocs.io/
+# FOGLAMP_END
+
+"""Measures how fast readings rows are turned into OMF values
+
+Compares probing every known sensor key with try/except KeyError (the
+previous create_data_values_stream_message) with the extractors that
+omf_translator compiles for each OMF type. The rows are a synthetic
+in-memory table of TI sensorTag and mouse readings.
+
+Usage:
+    python -m benchmarks.omf_extract [--rows N]
+"""
+
+import argparse
+import collections
+import datetime
+import time
+
+from foglamp.translators import omf_translator
+
+__author__    = "Terris Linenbach"
+__copyright__ = "Copyright (c) 2017 OSIsoft, LLC"
+__license__   = "Apache 2.0"
+__version__   = "${VERSION}"
+
+_SENSOR_DATA_KEYS = ["x", "y", "z", "pressure", "lux", "humidity", "temperature",
+                     "object", "ambient", "left", "right", "magnet", "button"]
+"""The keys the previous implementation tried for every row"""
+
+_READINGS = {
+    "TI sensorTag/accelerometer": {"x": 1.2, "y": 0.3, "z": -9.8},
+    "TI sensorTag/humidity": {"humidity": 43.1, "temperature": 21.5},
+    "TI sensorTag/luxometer": {"lux": 320},
+    "TI sensorTag/pressure": {"pressure": 1013},
+    "TI sensorTag/temperature": {"object": 30.2, "ambient": 21.9},
+    "TI sensorTag/keys": {"left": "up", "right": "down", "magnet": "up"},
+    "mouse": {"button": "down"}
+}
+
+_Row = collections.namedtuple('_Row', 'id asset_code user_ts reading')
+
+
+def _rows(count):
+    asset_codes = list(_READINGS)
+    user_ts = datetime.datetime(2017, 1, 1)
+    return [_Row(i, asset_codes[i % len(asset_codes)], user_ts, _READINGS[asset_codes[i % len(asset_codes)]])
+            for i in range(count)]
+
+
+def _probe_keys(row):
+    values = {"Time": row.user_ts.isoformat()}
+    for data_key in _SENSOR_DATA_KEYS:
+        try:
+            values[data_key] = row.reading[data_key]
+        except KeyError:
+            pass
+    return values
+
+
+def _compiled(row):
+    return omf_translator._omf_value_extractors[omf_translator._sensor_name_type[row.asset_code]](row)
+
+
+def _rows_per_second(function, rows):
+    start_time = time.perf_counter()
+    for row in rows:
+        function(row)
+    return len(rows) / (time.perf_counter() - start_time)
+
+
+def main():
+    """Processes command-line arguments and runs the benchmark"""
+    parser = argparse.ArgumentParser(prog='python -m benchmarks.omf_extract',
+                                     description='Turns readings rows into OMF values')
+    parser.add_argument('--rows', type=int, default=1000000)
+    args = parser.parse_args()
+
+    omf_translator.initialize_plugin()
+    rows = _rows(args.rows)
+
+    assert all(_probe_keys(row) == _compiled(row) for row in rows[:len(_READINGS)])
+
+    before = _rows_per_second(_probe_keys, rows)
+    after = _rows_per_second(_compiled, rows)
+
+    print("Rows:               {}".format(args.rows))
+    print("Key probing:        {:.0f} rows/s".format(before))
+    print("Compiled extractor: {:.0f} rows/s ({:.1f}x)".format(after, after / before))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,82 @@
+# -*- coding: utf-8 -*-
+
+# FOGLAMP_BEGIN
+# See: http://foglamp.readthedocs.io/
+# FOGLAMP_END
+
+"""Measures the cost per message of decoding and validating sensor-values payloads
+
+Compares cbor2.loads followed by ad hoc key lookups (the previous
+handler), cbor2.loads followed by the compiled sensor-values schema,
+and the compiled schema alone.
+
+Usage:
+    python -m benchmarks.sensor_values_decode [--messages N [N ...]]
+"""
+
+import argparse
+import time
+import uuid
+
+import cbor2
+
+from foglamp.device.coap.sensor_values import SensorValues, _validate_payload
+
+__author__    = "Terris Linenbach"
+__copyright__ = "Copyright (c) 2017 OSIsoft, LLC"
+__license__   = "Apache 2.0"
+__version__   = "${VERSION}"
+
+
+def _messages(count):
+    return [cbor2.dumps({'timestamp': '2017-01-02T01:02:03.23232Z-05:00',
+                         'asset': 'pump{}'.format(i % 10),
+                         'key': str(uuid.uuid4()),
+                         'sensor_values': {'velocity': i, 'temperature': {'value': 32, 'unit': 'kelvin'}}})
+            for i in range(count)]
+
+
+def _lookup_keys(payload):
+    try:
+        asset = payload['asset']
+        timestamp = payload['timestamp']
+    except:
+        return None
+
+    return {'asset_code': asset,
+            'timestamp': timestamp,
+            'key': payload.get('key'),
+            'readings': payload.get('sensor_values', {})}
+
+
+def _time(function, items):
+    start_time = time.perf_counter()
+    for item in items:
+        function(item)
+    return time.perf_counter() - start_time
+
+
+def main():
+    """Processes command-line arguments and runs the benchmark"""
+    parser = argparse.ArgumentParser(prog='python -m benchmarks.sensor_values_decode',
+                                     description='Decodes and validates sensor-values payloads')
+    parser.add_argument('--messages', type=int, nargs='+', default=[1000, 10000, 100000])
+    args = parser.parse_args()
+
+    print("{:>9} {:>18} {:>18} {:>18}".format(
+        'messages', 'loads+lookup us', 'loads+schema us', 'schema only us'))
+
+    for count in args.messages:
+        messages = _messages(count)
+        payloads = [cbor2.loads(message) for message in messages]
+
+        lookup = _time(lambda message: _lookup_keys(cbor2.loads(message)), messages)
+        schema = _time(lambda message: SensorValues._parse_reading(cbor2.loads(message)), messages)
+        validate = _time(_validate_payload, payloads)
+
+        print("{:>9} {:>18.2f} {:>18.2f} {:>18.2f}".format(
+            count, lookup / count * 1e6, schema / count * 1e6, validate / count * 1e6))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,105 @@
+# -*- coding: utf-8 -*-
+
+# FOGLAMP_BEGIN
+# See: http://foglamp.readthedocs.io/
+# FOGLAMP_END
+
+"""Measures how fast readings are spooled and replayed from a spool file
+
+Replay decodes spooled readings in batches. With --connection-string,
+replayed readings are also inserted into foglamp.readings the way the
+device service drains its spool.
+
+Usage:
+    python -m benchmarks.spool_replay [--readings N] [--record-size N]
+        [--fsync-policy always|interval|never] [--connection-string DSN]
+"""
+
+import argparse
+import asyncio
+import os
+import tempfile
+import time
+import uuid
+
+from foglamp.device.ingest import Ingest
+from foglamp.device.spool import FSYNC_POLICIES, Spool
+from foglamp.storage_pool import StoragePool
+
+__author__    = "Terris Linenbach"
+__copyright__ = "Copyright (c) 2017 OSIsoft, LLC"
+__license__   = "Apache 2.0"
+__version__   = "${VERSION}"
+
+
+def _reading(i):
+    return {'asset_code': 'benchmark',
+            'read_key': str(uuid.uuid4()),
+            'user_ts': '2017-01-01T00:00:00Z',
+            'reading': {'x': i, 'y': i * 0.5}}
+
+
+def _spool(spool, count, record_size):
+    start_time = time.perf_counter()
+    for first in range(0, count, record_size):
+        spool.append([_reading(i) for i in range(first, min(first + record_size, count))])
+    spool.flush()
+    return time.perf_counter() - start_time
+
+
+async def _replay(spool, batch_size, connection_string):
+    storage_pool = None
+    ingest = None
+    if connection_string:
+        storage_pool = StoragePool(connection_string=connection_string)
+        await storage_pool.start()
+        ingest = Ingest(storage_pool)
+
+    start_time = time.perf_counter()
+    while len(spool):
+        readings, length = spool.peek(batch_size)
+        if ingest is not None:
+            await ingest._insert_spooled(readings)
+        spool.consume(length, len(readings))
+    elapsed = time.perf_counter() - start_time
+
+    if storage_pool is not None:
+        await storage_pool.stop()
+
+    return elapsed
+
+
+def main():
+    """Processes command-line arguments and runs the benchmark"""
+    parser = argparse.ArgumentParser(prog='python -m benchmarks.spool_replay',
+                                     description='Spools and replays readings')
+    parser.add_argument('--readings', type=int, default=100000)
+    parser.add_argument('--record-size', type=int, default=100,
+                        help='readings per spool record (the ingest batch size)')
+    parser.add_argument('--batch-size', type=int, default=1000,
+                        help='readings per replay batch')
+    parser.add_argument('--fsync-policy', choices=FSYNC_POLICIES, default='interval')
+    parser.add_argument('--spool-size', type=int, default=256, help='megabytes')
+    parser.add_argument('--connection-string',
+                        help='insert replayed readings into this database')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        spool = Spool(os.path.join(directory, 'readings.spool'),
+                      size=args.spool_size * 1024 * 1024, fsync_policy=args.fsync_policy)
+        spool.open()
+
+        elapsed = _spool(spool, args.readings, args.record_size)
+        print("Spooled {} readings in {:.2f} seconds ({:.0f} readings/s, {} bytes)".format(
+            args.readings, elapsed, args.readings / elapsed, spool.get_statistics()['used']))
+
+        elapsed = asyncio.get_event_loop().run_until_complete(
+            _replay(spool, args.batch_size, args.connection_string))
+        print("Replayed {} readings in {:.2f} seconds ({:.0f} readings/s)".format(
+            args.readings, elapsed, args.readings / elapsed))
+
+        spool.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -11,6 +11,8 @@ import datetime
 import math
 import asyncio
 import collections
+import os
+import signal
 import uuid
 import logging  # TODO: Delete me
 import sys  # TODO: Needed for logging delete me
@@ -75,6 +77,32 @@ class Scheduler(object):
         'id name type time day interval repeat_seconds exclusive process_name')
     """Represents a row in the schedules table"""
 
+    class _CoroutineProcess(object):
+        """Runs a coroutine in this process in place of a task's subprocess
+
+        Has the attributes and methods of asyncio.subprocess.Process the
+        scheduler uses. wait() returns 0 when the coroutine returns, 1 when
+        it raises and -SIGTERM when it is terminated.
+        """
+        __slots__ = ['pid', '_task']
+
+        def __init__(self, coroutine):
+            self.pid = os.getpid()
+            self._task = asyncio.ensure_future(coroutine)
+
+        def terminate(self):
+            self._task.cancel()
+
+        async def wait(self):
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                return -signal.SIGTERM
+            except Exception:
+                logging.getLogger(__name__).exception("In-process task failed")
+                return 1
+            return 0
+
     class _ScheduleExecution:
         """Tracks information about schedules"""
         __slots__ = ['next_start_time', 'task_processes']
@@ -101,7 +129,14 @@ class Scheduler(object):
     _schedules_tbl = None  # type: sa.Table
     _tasks_tbl = None  # type: sa.Table
 
-    def __init__(self):
+    def __init__(self, coroutines=None):
+        """
+        Args:
+            coroutines: Maps the names of scheduled processes to coroutine
+                functions. Tasks of these processes call the function and
+                run the coroutine in this process instead of starting the
+                process's script.
+        """
         # Class variables (begin)
         if self._schedules_tbl is None:
             self._schedules_tbl = sa.Table(
@@ -142,6 +177,8 @@ class Scheduler(object):
         """When True, the scheduler will not start any new tasks"""
         self._process_scripts = dict()
         """Dictionary of scheduled_processes.id to script. Immutable."""
+        self._coroutines = coroutines or dict()
+        """Dictionary of scheduled_processes.id to coroutine function run in-process. Immutable."""
         self._schedules = dict()
         """Dictionary of schedules.id to _Schedule"""
         self._schedule_executions = dict()
@@ -219,7 +256,11 @@ class Scheduler(object):
         process = None
 
         try:
-            process = await asyncio.create_subprocess_exec(*args)
+            coroutine_function = self._coroutines.get(schedule.process_name)
+            if coroutine_function is None:
+                process = await asyncio.create_subprocess_exec(*args)
+            else:
+                process = self._CoroutineProcess(coroutine_function())
         except IOError:
             # TODO: catch real exception
             logging.getLogger(__name__).exception(
@@ -13,6 +13,8 @@ from aiohttp import web
 from foglamp.core import routes
 from foglamp.core import middleware
 from foglamp.core.scheduler import Scheduler
+from foglamp.data_purge import purge
+from foglamp.storage_pool import StoragePool
 
 __author__ = "Praveen Garg, Terris Linenbach"
 __copyright__ = "Copyright (c) 2017 OSIsoft, LLC"
@@ -25,8 +27,12 @@ class Server:
 
     # Class attributes (begin)
     __scheduler = None
+    __storage_pool = None
+    """Connections of the tasks that run in the server's process"""
     # Class attributes (end)
 
+    _STORAGE_POOL_MAX_SIZE = 5
+
     @classmethod
     def start(cls, loop=None):
         """Starts the server"""
@@ -40,7 +46,11 @@ class Server:
                 signal_name,
                 lambda: asyncio.ensure_future(cls.stop(loop)))
 
-        cls.__scheduler = Scheduler()
+        cls.__storage_pool = StoragePool(min_size=1, max_size=cls._STORAGE_POOL_MAX_SIZE)
+        loop.run_until_complete(cls.__storage_pool.start())
+
+        # The purge runs in this process, without starting an interpreter and connecting each time
+        cls.__scheduler = Scheduler(coroutines={'purge': lambda: purge.run(cls.__storage_pool)})
         cls.__scheduler.start()
 
         # https://aiohttp.readthedocs.io/en/stable/_modules/aiohttp/web.html#run_app
@@ -67,6 +77,7 @@ class Server:
             A task is still running. Wait and try again.
         """
         await cls.__scheduler.stop()
+        await cls.__storage_pool.stop()
 
         for task in asyncio.Task.all_tasks():
             task.cancel()
@@ -5,7 +5,7 @@ Description: Based on FOGL-200 (https://docs.google.com/document/d/1GdMTerNq_-XQ
     
     As of now, all dependencies, with the exception of the database layer have been settled, and being used. These are
     -> configurations 
-    -> retrieval of last ID sent to the Historian
+    -> retrieval of last ID sent to the Historian, the lowest position of the active streams
      
      As for the database layer, the code currently uses SQLAlchemy, but can easily be switched out to use some other 
     tool to communicate with the database. 
@@ -27,12 +27,14 @@ Description: Based on FOGL-200 (https://docs.google.com/document/d/1GdMTerNq_-XQ
      total_failed_to_remove > total_rows_removed then PURGE completely failed. 
 """
 #!/usr/bin/python3
+import asyncio
 import datetime
-import random
 import sqlalchemy
 import sqlalchemy.dialects.postgresql
 import time
 from foglamp import configuration_manager
+from foglamp.data_purge import partitions
+from foglamp.storage_pool import StoragePool
 
 """Script information and connection to the Database
 """
@@ -42,17 +44,13 @@ __license__ = "Apache 2.0"
 __version__ = "${VERSION}"
 
 
-# Set variables for connecting to database
-_db_type = "postgres"
+# Set variables for connecting to database. No connection is opened until a purge runs.
+_db_type = "postgresql"
 _user = "foglamp"
 _db_user = "foglamp"
 _host = "127.0.0.1"
 _db = "foglamp"
-
-# Create Connection
-_ENGINE = sqlalchemy.create_engine('%s://%s:%s@%s/%s' % (_db_type, _db_user, _user, _host, _db),  pool_size=20,
-                                   max_overflow=0)
-_CONN = _ENGINE.connect()
+_CONNECTION_STRING = '%s://%s:%s@%s/%s' % (_db_type, _db_user, _user, _host, _db)
 
 _DEFAULT_PURGE_CONFIG = {
     "age": {
@@ -61,9 +59,24 @@ _DEFAULT_PURGE_CONFIG = {
         "default": "72"
     },
     "retainUnsent": {
-        "description": "Retain data that has not been sent to any historian yet.",
+        "description": "Retain data that has not been sent to every active stream yet.",
         "type": "boolean",
         "default": "False"
+    },
+    "chunkSize": {
+        "description": "Number of rows removed by each DELETE. Smaller chunks hold locks for less time.",
+        "type": "integer",
+        "default": "10000"
+    },
+    "chunkPause": {
+        "description": "Time to wait between two chunks, so that concurrent inserts are not stalled. (in milliseconds)",
+        "type": "integer",
+        "default": "50"
+    },
+    "timeBudget": {
+        "description": "Maximum duration of a purge, the rows left are removed by the next purge. (in seconds)",
+        "type": "integer",
+        "default": "600"
     }
 }
 
@@ -111,20 +124,19 @@ _PURGE_LOGGING_TABLE = sqlalchemy.Table('purge_logging', sqlalchemy.MetaData(),
 """Methods that support the purge process.  
 """
 
-def get_nth_id() -> int:
-    """Update the config file to have row ID somewhere within the oldest 100 rows.
-    This method would potentially be replaced by a mechanism that is aware what was the last value sent to the
-     historian.
+async def get_last_sent_id(conn) -> int:
+    """Get the last row ID sent to every active stream, the lowest last_object of the active streams. One lookup in
+    the partial index streams_ix1, however many destinations there are.
+    Args:
+        conn: aiopg.sa connection
     Returns:
-        Method doesn't return anything
+        Last row ID sent to every active stream. 0, nothing sent, when no stream is active
     """
-    rand = random.randint(1, 100)
-    stmt = "SELECT id FROM (SELECT id FROM readings ORDER BY id ASC LIMIT %s)t ORDER BY id DESC LIMIT 1"
-    row_id = execute_command_with_return_value(stmt % rand)
-    try:
-        return int(row_id[0][0])
-    except IndexError:
-        return 1
+    stmt = "SELECT MIN(last_object) FROM foglamp.streams WHERE active"
+    row_id = await execute_command_with_return_value(conn, stmt)
+    if not row_id or row_id[0][0] is None:
+        return 0
+    return int(row_id[0][0])
 
 def convert_timestamp(set_time: str) -> datetime.timedelta:
     """Convert "age" in config file to timedelta. If only an integer is specified,  then 
@@ -162,26 +174,28 @@ def convert_timestamp(set_time: str) -> datetime.timedelta:
     return time_in_sec+time_in_min+time_in_hr+time_in_day
 
 
-def execute_command_with_return_value(stmt: str) -> dict:
+async def execute_command_with_return_value(conn, stmt: str) -> list:
     """Imitate connection to postgres that returns result.    
     Args:
+        conn: aiopg.sa connection
         stmt (str): generated SQL query   
     Returns:
         Returns result set 
     """
-    query_result = _CONN.execute(stmt)
-    return query_result.fetchall()
+    query_result = await conn.execute(stmt)
+    return await query_result.fetchall()
 
 
-def execute_command_without_return_value(stmt: str) -> None:
+async def execute_command_without_return_value(conn, stmt: str) -> None:
     """Imitate connection to Postgres and a query that doesn't generate results
     Args:
+        conn: aiopg.sa connection
         stmt (str): DELETE stmt 
     """
-    _CONN.execute(stmt)
+    await conn.execute(stmt)
 
 
-def set_id() -> int:
+async def set_id(conn) -> int:
     """
     Set the ID value for the next purge log table
     Args: 
@@ -191,90 +205,197 @@ def set_id() -> int:
     """
     stmt = sqlalchemy.select([_PURGE_LOGGING_TABLE.c.id]).select_from(_PURGE_LOGGING_TABLE).order_by(
         _PURGE_LOGGING_TABLE.c.id.desc()).limit(1)
-    result = execute_command_with_return_value(stmt)
+    result = await execute_command_with_return_value(conn, stmt)
     if not result:
         return 1
     return int(result[0][0])+1
 
 
+async def delete_in_chunks(conn, table_name, conditions: list, upper_id: int, chunk_size: int, chunk_pause: float,
+                           deadline: float, last_id: int) -> tuple:
+    """Delete the rows matching all of conditions in chunks of chunk_size rows, in id order.
+    Each chunk is a DELETE of its own, bounded by a keyset range on the primary key (id > after the last chunk AND
+    id <= upper_id), so locks are held and WAL is written for one chunk at a time, and no chunk walks the rows kept
+    above upper_id. Once the time.monotonic() deadline is reached, the rows left are kept for the next purge, which
+    starts again from the lowest id, where this one stopped.
+    Args:
+        conn: aiopg.sa connection, in autocommit mode
+        table_name: table to delete from
+        conditions (list): WHERE conditions the rows to delete match
+        upper_id (int): highest id a row to delete can have
+        chunk_size (int): maximum number of rows deleted by each DELETE
+        chunk_pause (float): seconds to wait between two chunks, during which other coroutines run
+        deadline (float): time.monotonic() value after which no chunk is started
+        last_id (int): last row ID sent to the historian
+    Returns:
+        Number of rows deleted, and how many of them were not sent, counted from the ids the DELETEs return
+    """
+    rows_removed = 0
+    unsent_rows_removed = 0
+    after_id = 0
+
+    while after_id < upper_id and time.monotonic() < deadline:
+        chunk_query = sqlalchemy.select([table_name.c.id]).where(table_name.c.id > after_id).where(
+            table_name.c.id <= upper_id)
+        for condition in conditions:
+            chunk_query = chunk_query.where(condition)
+        chunk_query = chunk_query.order_by(table_name.c.id).limit(chunk_size)
+
+        delete_query = sqlalchemy.delete(table_name).where(table_name.c.id.in_(chunk_query)).returning(
+            table_name.c.id)
+        deleted_ids = [row[0] for row in await execute_command_with_return_value(conn, delete_query)]
+        rows_removed += len(deleted_ids)
+        unsent_rows_removed += sum(1 for deleted_id in deleted_ids if deleted_id > last_id)
+
+        if len(deleted_ids) < chunk_size:
+            break
+
+        after_id = max(deleted_ids)
+        await asyncio.sleep(chunk_pause)
+
+    return rows_removed, unsent_rows_removed
+
+
+async def drop_expired_partitions(conn, bound: str, last_id: int, retain_unsent: bool) -> tuple:
+    """When the readings table is partitioned, DETACH and DROP the partitions whose whole range of ts is older than
+    bound, oldest first. This removes their rows without deleting them one by one.
+    Args:
+        conn: aiopg.sa connection
+        bound (str): timestamp the end of the range of a dropped partition is not after
+        last_id (int): last row ID sent to the historian
+        retain_unsent (bool): when True, a partition containing a row whose id is greater than last_id is kept, and
+            so are newer ones
+    Returns:
+        Estimated number of rows dropped, and of how many of them were not sent. The counts are not scanned: a
+        partition holds pg_class.reltuples rows (as of its last VACUUM or ANALYZE, else its span of ids), and the
+        share of them above last_id is taken from its lowest and highest ids
+    """
+    rows_removed = 0
+    unsent_rows_removed = 0
+
+    # The catalog columns of partitions do not exist before PostgreSQL 10
+    if not (await execute_command_with_return_value(conn, partitions.IS_PARTITIONED_QUERY))[0][0]:
+        return rows_removed, unsent_rows_removed
+
+    expired_query = sqlalchemy.text("SELECT relname FROM (%s) p(relname, start_ts, end_ts) WHERE end_ts <= :bound "
+                                    "ORDER BY end_ts" % partitions.PARTITIONS_QUERY).bindparams(bound=bound)
+
+    for partition in await execute_command_with_return_value(conn, expired_query):
+        partition_name = partition[0]
+
+        # Both ends of the primary key index and the planner's row count, without scanning the partition
+        probe = await execute_command_with_return_value(
+            conn, "SELECT min(id), max(id), (SELECT reltuples FROM pg_class WHERE oid = 'foglamp.%s'::regclass) "
+                  "FROM foglamp.%s" % (partition_name, partition_name))
+        min_id, max_id, reltuples = probe[0]
+
+        if min_id is None:
+            partition_rows = partition_unsent_rows = 0
+        else:
+            min_id, max_id = int(min_id), int(max_id)
+
+            if retain_unsent and max_id > last_id:
+                break
+
+            partition_rows = int(reltuples) if reltuples is not None and reltuples >= 0 else max_id - min_id + 1
+            if max_id <= last_id:
+                partition_unsent_rows = 0
+            elif min_id > last_id:
+                partition_unsent_rows = partition_rows
+            else:
+                partition_unsent_rows = partition_rows * (max_id - last_id) // (max_id - min_id + 1)
+
+        await execute_command_without_return_value(conn, "ALTER TABLE foglamp.readings DETACH PARTITION foglamp.%s"
+                                                   % partition_name)
+        await execute_command_without_return_value(conn, "DROP TABLE foglamp.%s" % partition_name)
+
+        rows_removed += partition_rows
+        unsent_rows_removed += partition_unsent_rows
+
+    return rows_removed, unsent_rows_removed
+
+
 """The actual purge process 
 """
 
 
-def purge(config) -> None:
+async def purge(conn, config) -> None:
     """The actual process read the configuration file, and based off the information in it does the following:
-    1. Gets previous information found in log file
-    2. Based on the configurations, call the DELETE command to purge the data
-    3. Calculate relevant information kept in logs
+    1. Gets previous information found in log file, and the last row ID sent to every active stream
+    2. Based on the configurations, drop the expired partitions of a partitioned readings table, then call the
+        DELETE command to purge the data left, in chunks of chunkSize rows, for at most timeBudget seconds
+    3. Calculate relevant information kept in logs, from the rows removed and the rows left in the range purged
     4. Based on the configuration calculates how long to wait until next purge, and returns that 
          
+    Args:
+        conn: aiopg.sa connection, in autocommit mode
     Returns:
         Amount of time until next purge process
     """
-    last_id = get_nth_id()
+    last_id = await get_last_sent_id(conn)
     table_name = _READING_TABLE  # This could be replaced with any table that would need to be purged.
 
+    chunk_size = int(config['chunkSize']['value'])
+    chunk_pause = int(config['chunkPause']['value']) / 1000
+    deadline = time.monotonic() + int(config['timeBudget']['value'])
+
     start_time = datetime.datetime.fromtimestamp(time.time())
 
     age_timestamp = datetime.datetime.strftime(start_time - convert_timestamp(
         set_time=config['age']['value']), '%Y-%m-%d %H:%M:%S.%f')
     start_time = start_time.strftime('%Y-%m-%d %H:%M:%S')
 
-    # Number of unsent rows
-    number_sent_rows_query = sqlalchemy.select([sqlalchemy.func.count()]).select_from(table_name).where(
-        table_name.c.ts <= start_time).where(table_name.c.id > last_id)
-
-    unsent_rows_before = execute_command_with_return_value(number_sent_rows_query)
-    unsent_rows_before = int(unsent_rows_before[0][0])
-
     """Time purge process starts
     If unsent data is retained, then the WHERE condition is against the last sent ID
     """
+    retain_unsent = config['retainUnsent']['value'] == 'True'
 
-    if config['retainUnsent']['value'] == 'True':
-        count_query = sqlalchemy.select([sqlalchemy.func.count()]).select_from(table_name).where(
-            table_name.c.id <= last_id).where(table_name.c.ts <= start_time)
-        total_count_before = execute_command_with_return_value(count_query)
-        total_count_before = int(total_count_before[0][0])
+    if retain_unsent:
+        conditions = [table_name.c.id <= last_id, table_name.c.ts <= start_time]
+        partition_bound = start_time
 
-        delete_query = sqlalchemy.delete(table_name).where(table_name.c.id <= last_id).where(
-            table_name.c.ts <= start_time)
-
-        execute_command_without_return_value(delete_query)
-
-        # Number of rows that were expected to get removed, but weren't
-        failed_removal_query = sqlalchemy.select([sqlalchemy.func.count()]).select_from(
-            table_name).where(table_name.c.id <= last_id).where(
-            table_name.c.ts <= start_time)
+    # If unsent data is not retained, then the WHERE condition is against the age
+    else:
+        conditions = [table_name.c.ts <= age_timestamp, table_name.c.ts < start_time]
+        partition_bound = age_timestamp
 
-        failed_removal_count = execute_command_with_return_value(failed_removal_query)
-        failed_removal_count = int(failed_removal_count[0][0])
-        total_rows_removed = total_count_before - failed_removal_count
+    total_rows_removed, unsent_rows_removed = await drop_expired_partitions(conn, partition_bound, last_id,
+                                                                            retain_unsent)
 
-    # If unsent data is not retained, then the WHERE condition is against the age
+    # The highest id a row to delete can have, found once so that no chunk walks the rows kept above it
+    if retain_unsent:
+        upper_id = last_id
     else:
-        count_query = sqlalchemy.select([sqlalchemy.func.count()]).select_from(table_name).where(
-            table_name.c.ts <= age_timestamp).where(table_name.c.ts <= start_time)
-        total_count_before = execute_command_with_return_value(count_query)
-        total_count_before = int(total_count_before[0][0])
-
-        delete_query = sqlalchemy.delete(table_name).where(table_name.c.ts <= age_timestamp).where(
-            table_name.c.ts < start_time)
-        execute_command_without_return_value(delete_query)
-
-        # Number of rows that were expected to get removed, but weren't
-        failed_removal_query = sqlalchemy.select([sqlalchemy.func.count()]).select_from(
-            table_name).where(table_name.c.ts <= age_timestamp).where(
-            table_name.c.ts <= start_time)
-        failed_removal_count = execute_command_with_return_value(failed_removal_query)
-        failed_removal_count = int(failed_removal_count[0][0])
-        total_rows_removed = total_count_before - failed_removal_count
-
-    # Total number of rows that remain under start_time
-    total_count = sqlalchemy.select([sqlalchemy.func.count()]).select_from(table_name).where(
-        table_name.c.ts < start_time)
-    total_count_after = execute_command_with_return_value(total_count)
-    total_count_after = int(total_count_after[0][0])
+        upper_query = sqlalchemy.select([sqlalchemy.func.max(table_name.c.id)]).where(
+            table_name.c.ts <= age_timestamp)
+        upper_id = (await execute_command_with_return_value(conn, upper_query))[0][0] or 0
+
+    rows_removed, unsent_rows = await delete_in_chunks(conn, table_name, conditions, upper_id, chunk_size,
+                                                       chunk_pause, deadline, last_id)
+    total_rows_removed += rows_removed
+    unsent_rows_removed += unsent_rows
+
+    """The remaining counts are exact in the range of ids just purged, and estimated from the ends of the primary key
+    above it, so that the rows kept are not scanned:
+    total_count_after - rows that remain
+    unsent_rows_after - unsent rows that remain (the unsent rows before are these and the removed ones)
+    failed_removal_count - rows that were expected to get removed, but weren't (or were left for the next purge)
+    """
+    remaining_query = sqlalchemy.select([
+        sqlalchemy.func.count(),
+        sqlalchemy.func.count().filter(table_name.c.id > last_id),
+        sqlalchemy.func.count().filter(sqlalchemy.and_(*conditions))]).select_from(table_name).where(
+        table_name.c.id <= upper_id)
+    remaining = await execute_command_with_return_value(conn, remaining_query)
+    total_count_after, unsent_rows_after, failed_removal_count = [int(count) for count in remaining[0]]
+
+    ends_query = sqlalchemy.select([sqlalchemy.func.min(table_name.c.id), sqlalchemy.func.max(table_name.c.id)])
+    min_id, max_id = (await execute_command_with_return_value(conn, ends_query))[0]
+    if max_id is not None and max_id > upper_id:
+        above_id = max(upper_id, int(min_id) - 1)
+        total_count_after += int(max_id) - above_id
+        unsent_rows_after += int(max_id) - max(above_id, last_id)
+    unsent_rows_before = unsent_rows_after + unsent_rows_removed
 
     # Time  purge process finished
     end_time = datetime.datetime.fromtimestamp(time.time()).strftime('%Y-%m-%d %H:%M:%S')
@@ -284,29 +405,47 @@ def purge(config) -> None:
     table_name - table that was purged PK
     start_time - time that purge process began
     end_time - time that purge process ended
-    total_rows_removed - number of rows removed 
-    total_unsent_rows - total number of unsent rows under start_time 
+    total_rows_removed - number of rows removed (estimated for the partitions dropped)
+    total_unsent_rows - total number of unsent rows (estimated above the range purged)
     total_failed_to_remove - total number of rows that failed to remove (this is the confirmation whether  purge 
                                                                             succeeded or not.) 
     """
-    inst_stmt = _PURGE_LOGGING_TABLE.insert().values(id=set_id(),
+    inst_stmt = _PURGE_LOGGING_TABLE.insert().values(id=await set_id(conn),
                                                      table_name=table_name.name, start_time=start_time,
                                                      end_time=end_time, total_rows_removed=total_rows_removed,
                                                      total_rows_remaining=total_count_after,
                                                      total_unsent_rows=unsent_rows_before,
                                                      total_failed_to_remove=failed_removal_count)
-    execute_command_without_return_value(inst_stmt)
+    await execute_command_without_return_value(conn, inst_stmt)
 
 
-def purge_main():
-    import asyncio
-    event_loop = asyncio.get_event_loop()
-    event_loop.run_until_complete(configuration_manager.create_category(_CONFIG_CATEGORY_NAME,_DEFAULT_PURGE_CONFIG,_CONFIG_CATEGORY_DESCRIPTION))
-    config = event_loop.run_until_complete(configuration_manager.get_category_all_items(_CONFIG_CATEGORY_NAME))
-    purge(config)
+async def run(storage_pool: StoragePool = None) -> None:
+    """Run one purge, as a coroutine of the core server or of the purge process.
+    Args:
+        storage_pool (StoragePool): a started pool the purge borrows one connection from, such as the core server's.
+            When None, a pool of one connection is opened for the purge and closed afterwards.
+    """
+    await configuration_manager.create_category(_CONFIG_CATEGORY_NAME, _DEFAULT_PURGE_CONFIG,
+                                                _CONFIG_CATEGORY_DESCRIPTION)
+    config = await configuration_manager.get_category_all_items(_CONFIG_CATEGORY_NAME)
 
-if __name__ == '__main__':
-    purge_main()
+    own_pool = storage_pool is None
+    if own_pool:
+        storage_pool = StoragePool(min_size=1, max_size=1, connection_string=_CONNECTION_STRING)
+        await storage_pool.start()
+
+    try:
+        async with storage_pool.acquire() as conn:
+            await purge(conn, config)
+    finally:
+        if own_pool:
+            await storage_pool.stop()
 
 
+def purge_main():
+    """Run one purge, as the scheduled process 'purge'"""
+    asyncio.get_event_loop().run_until_complete(run())
 
+
+if __name__ == '__main__':
+    purge_main()
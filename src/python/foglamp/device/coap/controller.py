@@ -1,17 +1,198 @@
-import asyncio
+import os
+
 import aiocoap
+import aiocoap.resource
 
+from foglamp import configuration_manager
+from foglamp.storage_pool import StoragePool
+from foglamp.device.ingest import Ingest
+from foglamp.device.spool import Spool
 from foglamp.device.coap.sensor_values import SensorValues
+from foglamp.device.coap.statistics import Statistics
+
+_CONFIG_CATEGORY_NAME = 'COAP_CONF'
+_CONFIG_CATEGORY_DESCRIPTION = 'CoAP device service'
+
+_DEFAULT_CONFIG = {
+    "workers": {
+        "description": "Number of processes that serve the CoAP port (SO_REUSEPORT). 1 serves requests in the device service process.",
+        "type": "integer",
+        "default": "1"
+    },
+    "poolMinSize": {
+        "description": "Number of database connections opened at startup and kept open",
+        "type": "integer",
+        "default": "2"
+    },
+    "poolMaxSize": {
+        "description": "Maximum number of database connections",
+        "type": "integer",
+        "default": "10"
+    },
+    "poolAcquireTimeout": {
+        "description": "Seconds to wait for a free database connection",
+        "type": "integer",
+        "default": "10"
+    },
+    "maxBatchSize": {
+        "description": "Maximum number of readings inserted by one statement",
+        "type": "integer",
+        "default": "100"
+    },
+    "maxBatchWait": {
+        "description": "Milliseconds a reading waits for its batch to fill before the batch is inserted",
+        "type": "integer",
+        "default": "50"
+    },
+    "recentKeysSize": {
+        "description": "Number of recently stored reading keys remembered to drop retransmitted readings (0 disables)",
+        "type": "integer",
+        "default": "10000"
+    },
+    "maxBufferedReadings": {
+        "description": "Readings waiting to be stored above which devices are answered with 5.03 Service Unavailable",
+        "type": "integer",
+        "default": "5000"
+    },
+    "busyMaxAge": {
+        "description": "Seconds devices are asked to wait (Max-Age) when answered with 5.03 Service Unavailable",
+        "type": "integer",
+        "default": "10"
+    },
+    "maxReadingsPerMessage": {
+        "description": "Maximum number of readings in one array payload. Longer arrays are answered with 4.13 Request Entity Too Large",
+        "type": "integer",
+        "default": "1000"
+    },
+    "spoolFile": {
+        "description": "File that keeps readings while the database is unavailable or saturated (empty disables)",
+        "type": "string",
+        "default": "~/var/spool/foglamp/readings.spool"
+    },
+    "spoolSize": {
+        "description": "Spool file size in megabytes",
+        "type": "integer",
+        "default": "64"
+    },
+    "spoolFsyncPolicy": {
+        "description": "When spooled readings are flushed to disk: always, interval or never",
+        "type": "string",
+        "default": "interval"
+    },
+    "spoolFsyncInterval": {
+        "description": "Milliseconds between flushes when spoolFsyncPolicy is interval",
+        "type": "integer",
+        "default": "1000"
+    },
+    "spoolBatchSize": {
+        "description": "Maximum number of spooled readings inserted by one statement",
+        "type": "integer",
+        "default": "1000"
+    },
+    "spoolRetryInterval": {
+        "description": "Seconds between attempts to insert spooled readings while the database is unavailable",
+        "type": "integer",
+        "default": "5"
+    }
+}
+
+_storage_pool = None  # type: StoragePool
+"""Shared by all CoAP handlers. Created by start()."""
+_spool = None  # type: Spool
+"""Keeps readings while the database is unavailable. Created by start()."""
+_ingest = None  # type: Ingest
+"""Batches readings from all CoAP handlers. Created by start()."""
+_server_context = None  # type: aiocoap.Context
+
+
+async def read_config():
+    """Creates the COAP_CONF category if needed and returns its items"""
+    await configuration_manager.create_category(_CONFIG_CATEGORY_NAME, _DEFAULT_CONFIG,
+                                                _CONFIG_CATEGORY_DESCRIPTION)
+    return await configuration_manager.get_category_all_items(_CONFIG_CATEGORY_NAME)
+
+
+def _spool_path(path, worker_id):
+    """Returns the spool file of a worker. Workers can not share a spool."""
+    path = os.path.expanduser(path)
+    if worker_id is None:
+        return path
+
+    root, extension = os.path.splitext(path)
+    return '{}-{}{}'.format(root, worker_id, extension)
+
+
+async def start(worker_id=None):
+    """Creates the storage pool and registers all CoAP URI handlers
 
+    Args:
+        worker_id: The number of the worker process, or None when the
+            device service runs a single process
+    """
+    global _storage_pool
+    global _spool
+    global _ingest
+    global _server_context
+
+    config = await read_config()
+
+    _storage_pool = StoragePool(min_size=int(config['poolMinSize']['value']),
+                                max_size=int(config['poolMaxSize']['value']),
+                                acquire_timeout=int(config['poolAcquireTimeout']['value']))
+    await _storage_pool.start()
+
+    if config['spoolFile']['value']:
+        _spool = Spool(_spool_path(config['spoolFile']['value'], worker_id),
+                       size=int(config['spoolSize']['value']) * 1024 * 1024,
+                       fsync_policy=config['spoolFsyncPolicy']['value'],
+                       fsync_interval=int(config['spoolFsyncInterval']['value']) / 1000)
+        _spool.open()
+
+    _ingest = Ingest(_storage_pool,
+                     max_batch_size=int(config['maxBatchSize']['value']),
+                     max_batch_wait_ms=int(config['maxBatchWait']['value']),
+                     recent_keys_size=int(config['recentKeysSize']['value']),
+                     max_buffered=int(config['maxBufferedReadings']['value']),
+                     spool=_spool,
+                     spool_batch_size=int(config['spoolBatchSize']['value']),
+                     spool_retry_seconds=int(config['spoolRetryInterval']['value']))
+    _ingest.start()
 
-def start():
-    """Registers all CoAP URI handlers"""
     root = aiocoap.resource.Site()
 
     # Register CoAP methods
     root.add_resource(('.well-known', 'core'),
                       aiocoap.resource.WKCResource(root.get_resources_as_linkheader))
 
-    SensorValues().register_handlers(root)
+    SensorValues(_ingest, busy_max_age=int(config['busyMaxAge']['value']),
+                 max_readings=int(config['maxReadingsPerMessage']['value'])).register_handlers(root)
+    statistics = {'storage_pool': _storage_pool, 'ingest': _ingest}
+    if _spool is not None:
+        statistics['spool'] = _spool
+    Statistics(statistics).register_handlers(root)
+
+    _server_context = await aiocoap.Context.create_server_context(root)
+
+
+async def stop():
+    """Stops accepting requests, inserts buffered readings and closes the storage pool"""
+    global _storage_pool
+    global _spool
+    global _ingest
+    global _server_context
+
+    if _server_context is not None:
+        await _server_context.shutdown()
+        _server_context = None
+
+    if _ingest is not None:
+        await _ingest.stop()
+        _ingest = None
+
+    if _spool is not None:
+        _spool.close()
+        _spool = None
 
-    asyncio.Task(aiocoap.Context.create_server_context(root))
+    if _storage_pool is not None:
+        await _storage_pool.stop()
+        _storage_pool = None
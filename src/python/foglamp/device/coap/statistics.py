@@ -0,0 +1,54 @@
+# -*- coding: utf-8 -*-
+"""FOGLAMP_PRELUDE_BEGIN
+{{FOGLAMP_LICENSE_DESCRIPTION}}
+
+See: http://foglamp.readthedocs.io/
+
+Copyright (c) 2017 OSIsoft, LLC
+License: Apache 2.0
+
+FOGLAMP_PRELUDE_END
+"""
+
+from cbor2 import dumps
+import aiocoap
+import aiocoap.resource
+
+"""CoAP handler for coap://other/statistics URI
+"""
+
+__author__ = 'Terris Linenbach'
+__version__ = '${VERSION}'
+
+
+class Statistics(aiocoap.resource.Resource):
+    """CoAP handler for coap://other/statistics URI"""
+
+    def __init__(self, sources):
+        """
+        Args:
+            sources: A dictionary of name to an object that provides get_statistics()
+        """
+        super(Statistics, self).__init__()
+        self._sources = sources
+
+    def register_handlers(self, resource_root):
+        """Registers other/statistics URI"""
+        resource_root.add_resource(('other', 'statistics'), self)
+        return
+
+    async def render_get(self, request):
+        """Returns the device service's runtime statistics
+
+        The CBOR payload looks like:
+        {
+            "storage_pool": {
+                "in_use": 2,
+                "waiters": 0,
+                "acquire_seconds_avg": 0.0003,
+                ...
+            }
+        }
+        """
+        statistics = {name: source.get_statistics() for name, source in self._sources.items()}
+        return aiocoap.Message(payload=dumps(statistics), code=aiocoap.numbers.codes.Code.CONTENT)
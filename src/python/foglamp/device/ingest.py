@@ -0,0 +1,460 @@
+# -*- coding: utf-8 -*-
+
+# FOGLAMP_BEGIN
+# See: http://foglamp.readthedocs.io/
+# FOGLAMP_END
+
+"""Buffers readings received by the device service and inserts them in batches"""
+
+import asyncio
+import collections
+import logging
+import time
+
+import psycopg2
+import sqlalchemy as sa
+from sqlalchemy.dialects.postgresql import JSONB, insert
+
+__author__    = "Terris Linenbach"
+__copyright__ = "Copyright (c) 2017 OSIsoft, LLC"
+__license__   = "Apache 2.0"
+__version__   = "${VERSION}"
+
+_readings_tbl = sa.Table(
+    'readings',
+    sa.MetaData(),
+    sa.Column('asset_code', sa.types.VARCHAR(50)),
+    sa.Column('read_key', sa.types.VARCHAR(50)),
+    sa.Column('user_ts', sa.types.TIMESTAMP),
+    sa.Column('reading', JSONB))
+"""Defines the table that data will be inserted into"""
+
+
+class Ingest(object):
+    """Collects readings from all handlers and inserts them with multi-row INSERTs
+
+    A batch is inserted when it reaches max_batch_size readings or
+    max_batch_wait_ms milliseconds after the loop started waiting for
+    it, whichever comes first. :meth:`add_reading` returns only after
+    the batch containing the reading is committed.
+
+    Readings whose read_key is already stored are dropped by the
+    database (ON CONFLICT DO NOTHING) and counted. Keys of recently
+    committed readings are also kept in memory so obvious retransmits
+    are dropped before they reach the database.
+
+    At most max_buffered readings wait to be inserted. Readings that
+    would take the buffer above this high-water mark are rejected with
+    asyncio.QueueFull so callers can tell devices to back off.
+
+    When a spool is given, readings are appended to it instead of being
+    rejected or failed when the buffer is above max_buffered or a batch
+    cannot be inserted. A background task inserts spooled readings in
+    batches of spool_batch_size once the database accepts them again.
+
+    Usage:
+        - Call :meth:`start`
+        - Call :meth:`add_reading` or :meth:`add_readings` from any number of coroutines
+        - Call :meth:`stop` to insert buffered readings and stop
+    """
+
+    def __init__(self, storage_pool, max_batch_size=100, max_batch_wait_ms=50, recent_keys_size=0,
+                 max_buffered=5000, spool=None, spool_batch_size=1000, spool_retry_seconds=5):
+        """
+        Args:
+            storage_pool: A started :class:`foglamp.storage_pool.StoragePool`
+            max_batch_size: Maximum number of readings per INSERT
+            max_batch_wait_ms: Maximum time a reading waits for its batch to fill
+            recent_keys_size: Number of committed read_keys remembered to
+                drop retransmitted readings. 0 disables the check.
+            max_buffered: High-water mark of readings waiting to be inserted
+            spool: An open :class:`foglamp.device.spool.Spool` or None
+            spool_batch_size: Maximum number of spooled readings per INSERT
+            spool_retry_seconds: Seconds between attempts to insert
+                spooled readings while the database is unavailable
+        """
+        self._storage_pool = storage_pool
+        self._max_batch_size = max_batch_size
+        self._max_batch_wait_seconds = max_batch_wait_ms / 1000
+        self._recent_keys_size = recent_keys_size
+        self._max_buffered = max_buffered
+        self._spool = spool
+        self._spool_batch_size = spool_batch_size
+        self._spool_retry_seconds = spool_retry_seconds
+
+        self._recent_keys = collections.OrderedDict()
+        """Least recently committed read_keys first. Values are not used."""
+
+        self._readings = []
+        """Column values of readings waiting to be inserted"""
+        self._futures = []
+        """Futures of the coroutines waiting in add_reading. Parallel to _readings."""
+        self._readings_added = None  # type: asyncio.Event
+        """Set when _readings is not empty"""
+        self._batch_full = None  # type: asyncio.Event
+        """Set when _readings holds at least max_batch_size readings"""
+        self._main_task = None  # type: asyncio.Task
+        """Inserts batches"""
+        self._drain_task = None  # type: asyncio.Task
+        """Inserts spooled readings"""
+        self._drain_wakeup = None  # type: asyncio.Event
+        """Set to interrupt the wait between attempts to insert spooled readings"""
+        self._stop = False
+        """When True, the main loop inserts what is buffered and exits"""
+        self._database_failing = False
+        """True from a failed insert to the next successful one. The traceback is logged once per outage."""
+
+        self._readings_inserted = 0
+        self._duplicates_dropped = 0
+        """Readings dropped by the database because their read_key exists"""
+        self._recent_duplicates_dropped = 0
+        """Readings dropped because their read_key is in _recent_keys"""
+        self._readings_rejected = 0
+        """Readings rejected because the buffer was above max_buffered"""
+        self._readings_spooled = 0
+        self._spooled_readings_inserted = 0
+        self._batches_inserted = 0
+        self._insert_failures = 0
+        self._insert_seconds_total = 0.0
+
+    def start(self):
+        """Starts inserting batches
+
+        Raises RuntimeError:
+            Ingest is already started
+        """
+        if self._main_task is not None:
+            raise RuntimeError("Ingest is already started")
+
+        self._stop = False
+        self._readings_added = asyncio.Event()
+        self._batch_full = asyncio.Event()
+        self._main_task = asyncio.ensure_future(self._main_loop())
+
+        if self._spool is not None:
+            self._drain_wakeup = asyncio.Event()
+            self._drain_task = asyncio.ensure_future(self._drain_loop())
+
+    async def stop(self):
+        """Inserts all buffered readings and stops"""
+        if self._main_task is None:
+            return
+
+        self._stop = True
+        self._readings_added.set()
+        self._batch_full.set()
+
+        await self._main_task
+        self._main_task = None
+
+        if self._drain_task is not None:
+            self._drain_wakeup.set()
+            await self._drain_task
+            self._drain_task = None
+
+    def _check_available(self, count):
+        """Returns False when the readings must be spooled instead of buffered"""
+        if self._main_task is None or self._stop:
+            raise RuntimeError("Ingest is not started")
+
+        if len(self._readings) + count <= self._max_buffered:
+            return True
+
+        if self._spool is None:
+            self._readings_rejected += count
+            raise asyncio.QueueFull()
+
+        return False
+
+    def _spool_readings(self, readings):
+        try:
+            self._spool.append(readings)
+        except asyncio.QueueFull:
+            self._readings_rejected += len(readings)
+            raise
+
+        self._readings_spooled += len(readings)
+        # The drain loop syncs the spool once the fsync interval passes
+        self._drain_wakeup.set()
+
+    def _is_recent_duplicate(self, key):
+        if key is None or key not in self._recent_keys:
+            return False
+
+        self._recent_duplicates_dropped += 1
+        return True
+
+    def _remember_keys(self, readings):
+        if not self._recent_keys_size:
+            return
+
+        for reading in readings:
+            key = reading['read_key']
+            if key is not None:
+                self._recent_keys[key] = None
+                self._recent_keys.move_to_end(key)
+
+        while len(self._recent_keys) > self._recent_keys_size:
+            self._recent_keys.popitem(last=False)
+
+    @staticmethod
+    def _reading_row(asset_code, timestamp, key=None, readings=None):
+        """Returns the column values of a reading"""
+        return {'asset_code': asset_code,
+                'read_key': key,
+                'user_ts': timestamp,
+                'reading': readings if readings is not None else {}}
+
+    def _buffer_reading(self, asset_code, timestamp, key=None, readings=None):
+        """Returns a future that is done when the reading is committed"""
+        future = asyncio.Future()
+
+        if self._is_recent_duplicate(key):
+            future.set_result(None)
+            return future
+
+        self._readings.append(self._reading_row(asset_code, timestamp, key, readings))
+        self._futures.append(future)
+
+        return future
+
+    def _readings_buffered(self):
+        self._readings_added.set()
+        if len(self._readings) >= self._max_batch_size:
+            self._batch_full.set()
+
+    async def add_reading(self, asset_code, timestamp, key=None, readings=None):
+        """Buffers a reading and waits until it is committed
+
+        Raises RuntimeError:
+            Ingest is not started
+
+        Raises asyncio.QueueFull:
+            The buffer is above its high-water mark and the reading
+            could not be spooled
+
+        Raises Exception:
+            The batch containing the reading could not be inserted or spooled
+
+        A reading that is dropped as a duplicate or spooled does not raise.
+        """
+        if not self._check_available(1):
+            self._spool_readings([self._reading_row(asset_code, timestamp, key, readings)])
+            return
+
+        future = self._buffer_reading(asset_code, timestamp, key, readings)
+        self._readings_buffered()
+        await future
+
+    async def add_readings(self, readings):
+        """Buffers several readings and waits until each is committed or failed
+
+        The readings are buffered together, so they are inserted by the
+        same statement unless there are more than max_batch_size of them.
+
+        Args:
+            readings: A list of dictionaries with the keyword arguments
+                of :meth:`add_reading`
+
+        Returns:
+            A list parallel to readings. Each element is None when the
+            reading was committed or dropped as a duplicate or the
+            exception that prevented it.
+
+        Raises RuntimeError:
+            Ingest is not started
+
+        Raises asyncio.QueueFull:
+            The buffer is above its high-water mark and the readings
+            could not be spooled. No reading is buffered.
+        """
+        if not self._check_available(len(readings)):
+            self._spool_readings([self._reading_row(**reading) for reading in readings])
+            return [None] * len(readings)
+
+        futures = [self._buffer_reading(**reading) for reading in readings]
+        self._readings_buffered()
+        return await asyncio.gather(*futures, return_exceptions=True)
+
+    async def _main_loop(self):
+        while True:
+            if not self._readings:
+                if self._stop:
+                    break
+
+                self._readings_added.clear()
+                await self._readings_added.wait()
+                continue
+
+            if len(self._readings) < self._max_batch_size and not self._stop:
+                try:
+                    await asyncio.wait_for(self._batch_full.wait(), self._max_batch_wait_seconds)
+                except asyncio.TimeoutError:
+                    pass
+
+            readings = self._readings[:self._max_batch_size]
+            futures = self._futures[:self._max_batch_size]
+            del self._readings[:self._max_batch_size]
+            del self._futures[:self._max_batch_size]
+
+            if len(self._readings) < self._max_batch_size and not self._stop:
+                self._batch_full.clear()
+
+            await self._insert_batch(readings, futures)
+
+    @staticmethod
+    def _insert_statement(readings):
+        # No conflict target: a partitioned readings table has no unique
+        # index on read_key, only one in each partition
+        return insert(_readings_tbl).values(readings).on_conflict_do_nothing()
+
+    async def _insert_batch(self, readings, futures):
+        start_time = time.monotonic()
+
+        try:
+            try:
+                async with self._storage_pool.acquire() as conn:
+                    result = await conn.execute(self._insert_statement(readings))
+            except psycopg2.DataError:
+                # One bad reading must not fail the others
+                await self._insert_one_by_one(readings, futures)
+                return
+        except Exception as e:
+            self._insert_failures += 1
+            self._log_insert_failure("Unable to insert %s readings", len(readings))
+
+            if self._spool is not None:
+                try:
+                    # Readings inserted one by one before the failure are not spooled again
+                    self._spool_readings([reading for reading, future in zip(readings, futures)
+                                          if not future.done()])
+                except asyncio.QueueFull:
+                    logging.getLogger(__name__).error("Unable to spool %s readings", len(readings))
+                else:
+                    for future in futures:
+                        if not future.done():
+                            future.set_result(None)
+                    return
+
+            for future in futures:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        self._log_insert_success()
+        self._batches_inserted += 1
+        self._readings_inserted += result.rowcount
+        self._duplicates_dropped += len(readings) - result.rowcount
+        self._insert_seconds_total += time.monotonic() - start_time
+        self._remember_keys(readings)
+
+        for future in futures:
+            if not future.done():
+                future.set_result(None)
+
+    def _log_insert_failure(self, message, *args):
+        """Logs the traceback of the first failure of an outage and one line for the next ones"""
+        if not self._database_failing:
+            self._database_failing = True
+            logging.getLogger(__name__).exception(message, *args)
+            return
+
+        spooled = len(self._spool) if self._spool is not None else 0
+        logging.getLogger(__name__).warning(message + " The database is still unavailable. %s readings spooled.",
+                                            *(args + (spooled,)))
+
+    def _log_insert_success(self):
+        if self._database_failing:
+            self._database_failing = False
+            logging.getLogger(__name__).info("The database is available again")
+
+    async def _insert_one_by_one(self, readings, futures):
+        async with self._storage_pool.acquire() as conn:
+            for reading, future in zip(readings, futures):
+                try:
+                    result = await conn.execute(self._insert_statement(reading))
+                except Exception as e:
+                    if not future.done():
+                        future.set_exception(e)
+                    continue
+
+                self._readings_inserted += result.rowcount
+                self._duplicates_dropped += 1 - result.rowcount
+                self._remember_keys((reading,))
+
+                if not future.done():
+                    future.set_result(None)
+
+    async def _drain_loop(self):
+        # time.monotonic() before which spooled readings are not inserted again
+        retry_time = 0.0
+
+        while not self._stop:
+            if len(self._spool) and len(self._readings) < self._max_batch_size \
+                    and time.monotonic() >= retry_time:
+                # Received readings are inserted first
+                readings, length = self._spool.peek(self._spool_batch_size)
+                try:
+                    await self._insert_spooled(readings)
+                except Exception:
+                    self._log_insert_failure("Unable to insert %s spooled readings. Retrying in %s seconds.",
+                                             len(readings), self._spool_retry_seconds)
+                    retry_time = time.monotonic() + self._spool_retry_seconds
+                else:
+                    self._log_insert_success()
+                    self._spool.consume(length, len(readings))
+                    continue
+
+            timeout = max(retry_time - time.monotonic(), 0) or self._spool_retry_seconds
+
+            # Appends and consumes are synced every fsync interval, even when none follows
+            flush_delay = self._spool.flush_when_due()
+            if flush_delay is not None:
+                timeout = min(timeout, flush_delay)
+
+            self._drain_wakeup.clear()
+            try:
+                await asyncio.wait_for(self._drain_wakeup.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+
+    async def _insert_spooled(self, readings):
+        async with self._storage_pool.acquire() as conn:
+            try:
+                result = await conn.execute(self._insert_statement(readings))
+                inserted = result.rowcount
+            except psycopg2.DataError:
+                # A reading that can never be inserted must not block the spool
+                inserted = 0
+                for reading in readings:
+                    try:
+                        result = await conn.execute(self._insert_statement(reading))
+                    except psycopg2.DataError:
+                        logging.getLogger(__name__).exception("Dropping spooled reading %s", reading)
+                        continue
+                    inserted += result.rowcount
+
+        self._spooled_readings_inserted += inserted
+        self._readings_inserted += inserted
+        self._duplicates_dropped += len(readings) - inserted
+
+    def get_statistics(self):
+        """Returns a dictionary of ingest statistics"""
+        insert_seconds_avg = 0.0
+        if self._batches_inserted:
+            insert_seconds_avg = self._insert_seconds_total / self._batches_inserted
+
+        return {
+            'buffered': len(self._readings),
+            'max_buffered': self._max_buffered,
+            'readings_rejected': self._readings_rejected,
+            'readings_spooled': self._readings_spooled,
+            'spooled_readings_inserted': self._spooled_readings_inserted,
+            'readings_inserted': self._readings_inserted,
+            'duplicates_dropped': self._duplicates_dropped,
+            'recent_duplicates_dropped': self._recent_duplicates_dropped,
+            'recent_keys': len(self._recent_keys),
+            'batches_inserted': self._batches_inserted,
+            'insert_failures': self._insert_failures,
+            'insert_seconds_avg': insert_seconds_avg
+        }
@@ -5,6 +5,11 @@
 # FOGLAMP_END
 
 import asyncio
+import logging
+import os
+import signal
+import socket
+import time
 
 from foglamp.device.coap import controller
 
@@ -13,9 +18,133 @@ __copyright__ = "Copyright (c) 2017 OSIsoft, LLC"
 __license__   = "Apache 2.0"
 __version__   = "${VERSION}"
 
+_STOP_SIGNALS = (signal.SIGINT, signal.SIGTERM, signal.SIGQUIT)
+
+_RESTART_DELAY_SECONDS = 1
+"""How long the supervisor waits before restarting a worker that exited"""
+
 
 def start():
-    """Starts the device service"""
-    controller.start()
-    asyncio.get_event_loop().run_forever()
+    """Starts the device service
+
+    When the COAP_CONF workers item is greater than 1, forks that many
+    worker processes that each bind the CoAP port with SO_REUSEPORT and
+    supervises them. Otherwise serves requests in this process.
+
+    Raises RuntimeError:
+        workers is greater than 1 but the installed aiocoap cannot bind
+        with SO_REUSEPORT
+    """
+    loop = asyncio.get_event_loop()
+    config = loop.run_until_complete(controller.read_config())
+    workers = int(config['workers']['value'])
+
+    if workers > 1 and not _reuse_port_supported():
+        # Every worker after the first would fail to bind and be restarted forever
+        raise RuntimeError("COAP_CONF workers is {} but the installed aiocoap does not bind with SO_REUSEPORT "
+                           "on this platform. Set workers to 1 or install aiocoap 0.4 or later.".format(workers))
+
+    if workers > 1:
+        loop.close()
+        _Supervisor(workers).run()
+    else:
+        _serve(loop)
+
+
+def _reuse_port_supported():
+    """Returns True when aiocoap binds with SO_REUSEPORT when AIOCOAP_REUSE_PORT is set"""
+    try:
+        from aiocoap.defaults import has_reuse_port
+    except ImportError:
+        # aiocoap 0.3 ignores AIOCOAP_REUSE_PORT
+        return False
+
+    return callable(has_reuse_port) and hasattr(socket, 'SO_REUSEPORT')
+
+
+def _serve(loop, worker_id=None):
+    for signal_name in _STOP_SIGNALS:
+        loop.add_signal_handler(
+            signal_name,
+            lambda: asyncio.ensure_future(stop(loop)))
+
+    loop.run_until_complete(controller.start(worker_id))
+    loop.run_forever()
+
+
+async def stop(loop):
+    """Stops the device service and the event loop"""
+    await controller.stop()
+    loop.stop()
+
+
+class _Supervisor(object):
+    """Forks worker processes and restarts the ones that exit
+
+    Each worker runs its own event loop, storage pool and ingest
+    pipeline. The kernel spreads datagrams sent to the CoAP port across
+    the workers' sockets.
+    """
+
+    def __init__(self, workers):
+        self._workers = workers
+        self._pids = {}
+        """Maps the process id of each running worker to its worker id"""
+        self._stopping = False
+
+    def run(self):
+        """Starts the workers and returns when they have all stopped"""
+        # aiocoap binds with SO_REUSEPORT only when asked to (0.4 and later)
+        os.environ['AIOCOAP_REUSE_PORT'] = '1'
+
+        for signal_name in _STOP_SIGNALS:
+            signal.signal(signal_name, self._stop)
+
+        for worker_id in range(self._workers):
+            self._fork(worker_id)
+
+        while self._pids:
+            try:
+                pid, status = os.wait()
+            except ChildProcessError:
+                break
+
+            worker_id = self._pids.pop(pid, None)
+            if worker_id is None or self._stopping:
+                continue
+
+            logging.getLogger(__name__).error(
+                "Device worker %s (pid %s) exited with status %s. Restarting.", worker_id, pid, status)
+            time.sleep(_RESTART_DELAY_SECONDS)
+
+            if not self._stopping:
+                self._fork(worker_id)
+
+    def _stop(self, signal_number, frame):
+        self._stopping = True
+        for pid in self._pids:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    def _fork(self, worker_id):
+        pid = os.fork()
+
+        if pid:
+            self._pids[pid] = worker_id
+            return
+
+        exit_code = 1
+        try:
+            for signal_name in _STOP_SIGNALS:
+                signal.signal(signal_name, signal.SIG_DFL)
 
+            loop = asyncio.new_event_loop()
+            asyncio.set_event_loop(loop)
+            _serve(loop, worker_id)
+            exit_code = 0
+        except Exception:
+            logging.getLogger(__name__).exception("Device worker %s failed", worker_id)
+        finally:
+            os._exit(exit_code)
@@ -0,0 +1,293 @@
+# -*- coding: utf-8 -*-
+
+# FOGLAMP_BEGIN
+# See: http://foglamp.readthedocs.io/
+# FOGLAMP_END
+
+"""Append-only memory-mapped spool for readings that could not be inserted
+
+The spool is a fixed-size file. The first 16 bytes hold the offsets of
+the oldest unread record and of the end of the last record. Each record
+is a 4-byte little-endian length followed by a CBOR-encoded list of
+readings. The header is updated after the record is written. A record
+torn by a crash, including one whose page did not reach the disk
+before the header's, is discarded with the records after it when the
+spool is opened again.
+"""
+
+import asyncio
+import logging
+import mmap
+import os
+import struct
+import time
+
+import cbor2
+
+__author__    = "Terris Linenbach"
+__copyright__ = "Copyright (c) 2017 OSIsoft, LLC"
+__license__   = "Apache 2.0"
+__version__   = "${VERSION}"
+
+_HEADER = struct.Struct('<QQ')
+"""read offset, write offset"""
+_RECORD_LENGTH = struct.Struct('<I')
+
+FSYNC_POLICIES = ('always', 'interval', 'never')
+
+
+class Spool(object):
+    """A memory-mapped FIFO of readings that survives restarts
+
+    Usage:
+        - Call :meth:`open`
+        - Call :meth:`append` to spool readings
+        - Call :meth:`peek` and then :meth:`consume` once the readings
+          returned by peek are committed. Only one consumer is supported.
+        - Call :meth:`close`
+    """
+
+    def __init__(self, path, size=64*1024*1024, fsync_policy='interval', fsync_interval=1.0):
+        """
+        Args:
+            path: Spool file. Created with its directory when it does not exist.
+            size: Spool file size in bytes
+            fsync_policy:
+                - always: flush to disk after every append
+                - interval: flush at most once per fsync_interval seconds
+                  (:meth:`flush` also flushes pending writes)
+                - never: leave it to the operating system
+
+        Raises ValueError:
+            Invalid fsync_policy or size
+        """
+        if fsync_policy not in FSYNC_POLICIES:
+            raise ValueError("fsync_policy must be one of {}".format(FSYNC_POLICIES))
+
+        if size <= _HEADER.size + _RECORD_LENGTH.size:
+            raise ValueError("size is too small")
+
+        self._path = path
+        self._size = size
+        self._fsync_policy = fsync_policy
+        self._fsync_interval = fsync_interval
+
+        self._file = None
+        self._mmap = None  # type: mmap.mmap
+        self._read_offset = _HEADER.size
+        self._write_offset = _HEADER.size
+        self._readings = 0
+        """Number of readings between _read_offset and _write_offset"""
+        self._dirty = False
+        """True when there are writes that have not been flushed"""
+        self._last_flush = 0.0
+
+        self._readings_spooled = 0
+        self._readings_consumed = 0
+        self._readings_rejected = 0
+        self._flushes = 0
+
+    def open(self):
+        """Maps the spool file and recovers readings spooled before a restart
+
+        Raises RuntimeError:
+            The spool is already open
+        """
+        if self._mmap is not None:
+            raise RuntimeError("Spool is already open")
+
+        directory = os.path.dirname(self._path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        self._file = open(self._path, 'a+b')
+        if os.fstat(self._file.fileno()).st_size != self._size:
+            # A spool created with another size is not readable. It is
+            # truncated rather than silently reinterpreted.
+            if os.fstat(self._file.fileno()).st_size:
+                logging.getLogger(__name__).warning(
+                    "Discarding spool %s: its size does not match %s bytes", self._path, self._size)
+            self._file.truncate(0)
+            self._file.truncate(self._size)
+
+        self._mmap = mmap.mmap(self._file.fileno(), self._size)
+        self._recover()
+
+    def close(self):
+        """Flushes and unmaps the spool file"""
+        if self._mmap is None:
+            return
+
+        self.flush()
+        self._mmap.close()
+        self._mmap = None
+        self._file.close()
+        self._file = None
+
+    def _recover(self):
+        read_offset, write_offset = _HEADER.unpack_from(self._mmap)
+
+        if not _HEADER.size <= read_offset <= write_offset <= self._size:
+            read_offset = write_offset = _HEADER.size
+
+        self._read_offset = read_offset
+        self._write_offset = write_offset
+        self._readings = 0
+
+        offset = read_offset
+        while offset < write_offset:
+            try:
+                readings, next_offset = self._read_record(offset)
+                if next_offset > write_offset or not isinstance(readings, list):
+                    raise ValueError("not a record of readings")
+            except (struct.error, ValueError, cbor2.CBORError) as e:
+                # The header page reached the disk before the record page
+                logging.getLogger(__name__).warning(
+                    "Discarding spool %s from offset %s: torn record (%s)", self._path, offset, e)
+                self._write_offset = offset
+                self._write_header()
+                break
+
+            self._readings += len(readings)
+            offset = next_offset
+
+        if self._readings:
+            logging.getLogger(__name__).info("Recovered %s spooled readings", self._readings)
+
+    def _write_header(self):
+        _HEADER.pack_into(self._mmap, 0, self._read_offset, self._write_offset)
+        self._dirty = True
+
+    def _read_record(self, offset):
+        """Returns the readings in the record at offset and the offset of the next record"""
+        (length,) = _RECORD_LENGTH.unpack_from(self._mmap, offset)
+        start = offset + _RECORD_LENGTH.size
+        return cbor2.loads(self._mmap[start:start + length]), start + length
+
+    def _compact(self):
+        """Moves unread records to the start of the spool"""
+        used = self._write_offset - self._read_offset
+        if self._read_offset > _HEADER.size:
+            self._mmap.move(_HEADER.size, self._read_offset, used)
+        self._read_offset = _HEADER.size
+        self._write_offset = _HEADER.size + used
+        self._write_header()
+
+    def append(self, readings):
+        """Spools a list of readings as one record
+
+        Args:
+            readings: A list of dictionaries that cbor2 can encode
+
+        Raises RuntimeError:
+            The spool is not open
+
+        Raises asyncio.QueueFull:
+            There is no room for the readings. Nothing is spooled.
+        """
+        if self._mmap is None:
+            raise RuntimeError("Spool is not open")
+
+        data = cbor2.dumps(readings)
+        length = _RECORD_LENGTH.size + len(data)
+
+        if self._write_offset + length > self._size:
+            self._compact()
+            if self._write_offset + length > self._size:
+                self._readings_rejected += len(readings)
+                raise asyncio.QueueFull()
+
+        _RECORD_LENGTH.pack_into(self._mmap, self._write_offset, len(data))
+        start = self._write_offset + _RECORD_LENGTH.size
+        self._mmap[start:start + len(data)] = data
+        self._write_offset += length
+        self._write_header()
+
+        self._readings += len(readings)
+        self._readings_spooled += len(readings)
+
+        if self._fsync_policy == 'always':
+            self.flush()
+        elif self._fsync_policy == 'interval' and time.monotonic() - self._last_flush >= self._fsync_interval:
+            self.flush()
+
+    def peek(self, max_readings):
+        """Returns the oldest spooled readings without removing them
+
+        Whole records are returned, so the last record may take the
+        number of readings above max_readings.
+
+        Returns:
+            A tuple (list of readings, number of bytes to pass to :meth:`consume`).
+            The number of bytes stays valid when readings are appended
+            in the meantime.
+        """
+        readings = []
+        offset = self._read_offset
+        while offset < self._write_offset and len(readings) < max_readings:
+            record, offset = self._read_record(offset)
+            readings.extend(record)
+        return readings, offset - self._read_offset
+
+    def consume(self, length, count):
+        """Removes the readings returned by :meth:`peek`
+
+        Args:
+            length: The number of bytes returned by peek
+            count: The number of readings returned by peek
+        """
+        self._read_offset += length
+        if self._read_offset == self._write_offset:
+            self._read_offset = self._write_offset = _HEADER.size
+        self._write_header()
+
+        self._readings -= count
+        self._readings_consumed += count
+
+        if self._fsync_policy == 'always':
+            self.flush()
+
+    def flush(self):
+        """Writes pending changes to disk"""
+        if self._dirty and self._mmap is not None and self._fsync_policy != 'never':
+            self._mmap.flush()
+            self._flushes += 1
+        self._dirty = False
+        self._last_flush = time.monotonic()
+
+    def flush_when_due(self):
+        """Flushes pending writes once fsync_interval has passed since the last flush
+
+        Lets the interval policy sync the last appended records without
+        waiting for another append.
+
+        Returns:
+            The number of seconds until pending writes are due, None when
+            nothing is pending
+        """
+        if not self._dirty:
+            return None
+
+        if self._fsync_policy == 'interval':
+            remaining = self._fsync_interval - (time.monotonic() - self._last_flush)
+            if remaining > 0:
+                return remaining
+
+        self.flush()
+        return None
+
+    def __len__(self):
+        """Returns the number of spooled readings"""
+        return self._readings
+
+    def get_statistics(self):
+        """Returns a dictionary of spool statistics"""
+        return {
+            'size': self._size,
+            'used': self._write_offset - self._read_offset,
+            'readings': self._readings,
+            'readings_spooled': self._readings_spooled,
+            'readings_consumed': self._readings_consumed,
+            'readings_rejected': self._readings_rejected,
+            'flushes': self._flushes
+        }
@@ -0,0 +1,115 @@
+# -*- coding: utf-8 -*-
+
+# FOGLAMP_BEGIN
+# See: http://foglamp.readthedocs.io/
+# FOGLAMP_END
+
+"""Compiles JSON schemas into validation functions
+
+Interpreting a schema for every message repeats the same dictionary
+walks. :func:`compile_schema` does that walk once and returns a
+function that only checks the instance.
+
+Supported keywords: type, properties, required and additionalProperties
+(boolean or schema). Other keywords are ignored, as are the
+descriptive keywords $schema, id, definitions and description.
+"""
+
+__author__    = "Terris Linenbach"
+__copyright__ = "Copyright (c) 2017 OSIsoft, LLC"
+__license__   = "Apache 2.0"
+__version__   = "${VERSION}"
+
+_TYPES = {
+    'object': dict,
+    'array': list,
+    'string': str,
+    'integer': int,
+    'number': (int, float),
+    'boolean': bool,
+    'null': type(None)
+}
+
+
+def _compile_type(schema_type):
+    """Returns a function that returns True when an instance has the type"""
+    if schema_type is None:
+        return None
+
+    if isinstance(schema_type, list):
+        checks = [_compile_type(one_type) for one_type in schema_type]
+        return lambda instance: any(check(instance) for check in checks)
+
+    try:
+        python_type = _TYPES[schema_type]
+    except KeyError:
+        raise ValueError("Unsupported type: {}".format(schema_type))
+
+    if schema_type in ('integer', 'number'):
+        # bool is a subclass of int but not a JSON number
+        return lambda instance: isinstance(instance, python_type) and not isinstance(instance, bool)
+
+    return lambda instance: isinstance(instance, python_type)
+
+
+def compile_schema(schema):
+    """Returns a function that validates an instance against schema
+
+    The function returns None when the instance is valid and a message
+    describing the first problem otherwise. It does not raise, so
+    callers can reject bad messages without exception handling.
+
+    Raises ValueError:
+        The schema uses an unsupported type
+    """
+    schema_type = schema.get('type')
+    check_type = _compile_type(schema_type)
+
+    properties = {name: compile_schema(property_schema)
+                  for name, property_schema in schema.get('properties', {}).items()}
+    required = tuple(schema.get('required', ()))
+
+    additional_properties = schema.get('additionalProperties', True)
+    validate_additional = None
+    if isinstance(additional_properties, dict):
+        validate_additional = compile_schema(additional_properties)
+        additional_properties = True
+
+    if not properties and not required and additional_properties is True and validate_additional is None:
+        if check_type is None:
+            return lambda instance: None
+
+        def validate_type(instance):
+            if not check_type(instance):
+                return "must be of type {}".format(schema_type)
+            return None
+
+        return validate_type
+
+    def validate(instance):
+        if check_type is not None and not check_type(instance):
+            return "must be of type {}".format(schema_type)
+
+        if not isinstance(instance, dict):
+            return None
+
+        for name in required:
+            if name not in instance:
+                return "{} is required".format(name)
+
+        for name, value in instance.items():
+            validate_property = properties.get(name)
+            if validate_property is None:
+                if not additional_properties:
+                    return "{} is not allowed".format(name)
+                validate_property = validate_additional
+                if validate_property is None:
+                    continue
+
+            error = validate_property(value)
+            if error is not None:
+                return "{} {}".format(name, error)
+
+        return None
+
+    return validate
@@ -0,0 +1,81 @@
+# -*- coding: utf-8 -*-
+
+# FOGLAMP_BEGIN
+# See: http://foglamp.readthedocs.io/
+# FOGLAMP_END
+
+"""Encodes and decodes JSON with the fastest library installed
+
+Uses orjson when it is installed and the standard json module
+otherwise. Both produce the same values; orjson writes compact JSON
+(no spaces after separators) and is several times faster.
+
+orjson does not handle integers beyond 64 bits: it refuses to encode
+them and decodes them to floats. Such objects are encoded, and texts
+that orjson decodes to a float of magnitude 2**63 or more are decoded
+again, by the standard json module, so big integers keep their exact
+value.
+"""
+
+import json
+
+try:
+    import orjson as _orjson
+except ImportError:
+    _orjson = None
+
+__author__    = "Terris Linenbach"
+__copyright__ = "Copyright (c) 2017 OSIsoft, LLC"
+__license__   = "Apache 2.0"
+__version__   = "${VERSION}"
+
+_BIG = float(2 ** 63)
+"""Magnitude from which a float decoded by orjson may be an integer it could not hold"""
+
+
+def library():
+    """Returns the name of the library in use: orjson or json"""
+    return 'json' if _orjson is None else 'orjson'
+
+
+def dumps(obj):
+    """Encodes obj as a JSON str"""
+    if _orjson is not None:
+        try:
+            return _orjson.dumps(obj).decode('utf-8')
+        except TypeError:
+            pass
+    return json.dumps(obj)
+
+
+def loads(text):
+    """Decodes a JSON str or bytes
+
+    Raises ValueError:
+        text is not valid JSON
+    """
+    if _orjson is not None:
+        value = _orjson.loads(text)
+        if not _has_big_float(value):
+            return value
+    return json.loads(text)
+
+
+def _has_big_float(value):
+    """Returns True when value holds a float of magnitude 2**63 or more"""
+    value_type = type(value)
+    if value_type is dict:
+        items = value.values()
+    elif value_type is list:
+        items = value
+    else:
+        return value_type is float and not -_BIG < value < _BIG
+
+    for item in items:
+        item_type = type(item)
+        if item_type is float:
+            if not -_BIG < item < _BIG:
+                return True
+        elif (item_type is dict or item_type is list) and _has_big_float(item):
+            return True
+    return False
@@ -11,7 +11,8 @@ setup(
     packages=['foglamp'],
     entry_points={
         'console_scripts': [
-            'foglamp = foglamp.core.server_daemon:main'
+            'foglamp = foglamp.core.server_daemon:main',
+            'foglamp-bulk-load = foglamp.bulk_load.loader:main'
         ],
     },
     zip_safe=False
@@ -0,0 +1,82 @@
+# -*- coding: utf-8 -*-
+
+# FOGLAMP_BEGIN
+# See: http://foglamp.readthedocs.io/
+# FOGLAMP_END
+
+import csv
+import io
+import json
+
+from cbor2 import dumps
+
+from foglamp.bulk_load import loader
+
+__author__    = "Terris Linenbach"
+__copyright__ = "Copyright (c) 2017 OSIsoft, LLC"
+__license__   = "Apache 2.0"
+__version__   = "${VERSION}"
+
+
+def _readings(count):
+    return [{'asset': 'pump{}'.format(i),
+             'timestamp': '2017-01-01T00:00:00Z',
+             'sensor_values': {'velocity': i}} for i in range(count)]
+
+
+class TestCsvReadingsStream:
+    """Unit tests for the stream COPY reads from
+    """
+    def test_rows(self):
+        """Rows hold asset_code, read_key, reading and user_ts in CSV form"""
+        readings = _readings(3)
+        readings[1]['key'] = '123e4567-e89b-12d3-a456-426655440000'
+        stream = loader._CsvReadingsStream(iter(readings), batch_size=10)
+
+        rows = list(csv.reader(io.StringIO(stream.read())))
+
+        assert stream.exhausted
+        assert stream.rows == 3
+        assert rows[0] == ['pump0', '', json.dumps({'velocity': 0}), '2017-01-01T00:00:00Z']
+        assert rows[1][1] == '123e4567-e89b-12d3-a456-426655440000'
+
+    def test_batch_size(self):
+        """A stream stops after batch_size readings"""
+        readings = iter(_readings(2500))
+        stream = loader._CsvReadingsStream(readings, batch_size=2000)
+
+        chunks = []
+        while True:
+            chunk = stream.read(8192)
+            if not chunk:
+                break
+            chunks.append(chunk)
+
+        assert stream.rows == 2000
+        assert not stream.exhausted
+        assert ''.join(chunks).count('\n') == 2000
+        assert len(list(readings)) == 500
+
+    def test_rejected(self):
+        """Readings without asset or timestamp are skipped"""
+        stream = loader._CsvReadingsStream(iter([{'asset': 'pump'}, 'hello world'] + _readings(1)), 10)
+
+        stream.read()
+
+        assert stream.rows == 1
+        assert stream.rejected == 2
+
+
+def test_read_cbor():
+    """CBOR files hold readings and arrays of readings"""
+    readings = _readings(3)
+    file = io.BufferedReader(io.BytesIO(dumps(readings[0]) + dumps(readings[1:])))
+
+    assert list(loader.read_cbor(file)) == readings
+
+
+def test_read_json_lines():
+    readings = _readings(2)
+    file = io.StringIO('\n'.join(json.dumps(reading) for reading in readings) + '\n\n')
+
+    assert list(loader.read_json_lines(file)) == readings
@@ -0,0 +1,99 @@
+# -*- coding: utf-8 -*-
+
+# FOGLAMP_BEGIN
+# See: http://foglamp.readthedocs.io/
+# FOGLAMP_END
+
+import asyncio
+import os
+import signal
+import pytest
+
+from foglamp.core import scheduler
+from foglamp.core.scheduler import Scheduler
+
+__author__    = "Terris Linenbach"
+__copyright__ = "Copyright (c) 2017 OSIsoft, LLC"
+__license__   = "Apache 2.0"
+__version__   = "${VERSION}"
+
+
+class TestCoroutineProcess:
+    """Unit tests for the process of a task run in-process
+    """
+    @pytest.mark.asyncio
+    async def test_success(self):
+        async def task():
+            pass
+
+        process = Scheduler._CoroutineProcess(task())
+
+        assert process.pid == os.getpid()
+        assert await process.wait() == 0
+
+    @pytest.mark.asyncio
+    async def test_exception(self):
+        async def task():
+            raise ValueError()
+
+        process = Scheduler._CoroutineProcess(task())
+
+        assert await process.wait() == 1
+
+    @pytest.mark.asyncio
+    async def test_terminate(self):
+        async def task():
+            await asyncio.sleep(60)
+
+        process = Scheduler._CoroutineProcess(task())
+        await asyncio.sleep(0)
+        process.terminate()
+
+        assert await process.wait() == -signal.SIGTERM
+
+
+class TestStartTask:
+    """Unit tests for starting the task of a schedule
+    """
+    @staticmethod
+    def _scheduler(coroutines=None):
+        schedule = Scheduler._Schedule(id='schedule', name='purge', type=Scheduler._ScheduleType.INTERVAL,
+                                       time=None, day=None, interval=None, repeat_seconds=3600,
+                                       exclusive=True, process_name='purge')
+        task_scheduler = Scheduler(coroutines=coroutines)
+        task_scheduler._process_scripts['purge'] = ['python3', '-m', 'foglamp.data_purge']
+        task_scheduler._schedules[schedule.id] = schedule
+        task_scheduler._schedule_executions[schedule.id] = Scheduler._ScheduleExecution()
+        return task_scheduler, schedule
+
+    @pytest.mark.asyncio
+    async def test_coroutine(self, mocker):
+        """A process with a coroutine function runs in-process"""
+        purged = []
+
+        async def purge():
+            purged.append(True)
+
+        create_subprocess_exec = mocker.patch.object(scheduler.asyncio, 'create_subprocess_exec')
+        task_scheduler, schedule = self._scheduler({'purge': purge})
+
+        task_id = await task_scheduler._start_task(schedule)
+        process = task_scheduler._schedule_executions[schedule.id].task_processes[task_id]
+
+        assert isinstance(process, Scheduler._CoroutineProcess)
+        assert await process.wait() == 0
+        assert purged == [True]
+        assert not create_subprocess_exec.called
+
+    @pytest.mark.asyncio
+    async def test_subprocess(self, mocker):
+        """Other processes run their script"""
+        async def create_subprocess_exec(*args):
+            return mocker.MagicMock(pid=1)
+
+        create_subprocess = mocker.patch.object(scheduler.asyncio, 'create_subprocess_exec',
+                                                side_effect=create_subprocess_exec)
+        task_scheduler, schedule = self._scheduler()
+
+        assert await task_scheduler._start_task(schedule)
+        create_subprocess.assert_called_once_with('python3', '-m', 'foglamp.data_purge')
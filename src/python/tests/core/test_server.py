@@ -0,0 +1,54 @@
+# -*- coding: utf-8 -*-
+
+# FOGLAMP_BEGIN
+# See: http://foglamp.readthedocs.io/
+# FOGLAMP_END
+
+import pytest
+
+from foglamp.core import server
+from foglamp.core.server import Server
+
+__author__    = "Terris Linenbach"
+__copyright__ = "Copyright (c) 2017 OSIsoft, LLC"
+__license__   = "Apache 2.0"
+__version__   = "${VERSION}"
+
+
+class TestServer:
+    """Unit tests for the wiring of the core server
+    """
+    @pytest.mark.asyncio
+    async def test_start_stop(self, mocker):
+        """The scheduler runs the purge on the server's storage pool, which stop closes"""
+        async def stop():
+            stopped.append(True)
+
+        async def purge_run(storage_pool):
+            purged.append(storage_pool)
+
+        purged = []
+        stopped = []
+        storage_pool_class = mocker.patch.object(server, 'StoragePool')
+        storage_pool = storage_pool_class.return_value
+        storage_pool.stop.side_effect = stop
+        scheduler_class = mocker.patch.object(server, 'Scheduler')
+        scheduler_class.return_value.stop.side_effect = stop
+        mocker.patch.object(server.purge, 'run', side_effect=purge_run)
+        mocker.patch.object(server.web, 'run_app')
+        loop = mocker.MagicMock()
+
+        Server.start(loop)
+
+        loop.run_until_complete.assert_called_once_with(storage_pool.start.return_value)
+        coroutines = scheduler_class.call_args[1]['coroutines']
+        assert list(coroutines) == ['purge']
+        await coroutines['purge']()
+        assert purged == [storage_pool]
+
+        # Does not cancel the tasks of the test
+        mocker.patch.object(server, 'asyncio')
+        await Server.stop(loop)
+
+        assert stopped == [True, True]
+        assert loop.stop.called
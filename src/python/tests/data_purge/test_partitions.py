@@ -0,0 +1,50 @@
+# -*- coding: utf-8 -*-
+
+# FOGLAMP_BEGIN
+# See: http://foglamp.readthedocs.io/
+# FOGLAMP_END
+
+import datetime
+import pytest
+
+from foglamp.data_purge import partitions
+
+__author__    = "Terris Linenbach"
+__copyright__ = "Copyright (c) 2017 OSIsoft, LLC"
+__license__   = "Apache 2.0"
+__version__   = "${VERSION}"
+
+
+def _utc(*args):
+    return datetime.datetime(*args, tzinfo=datetime.timezone.utc)
+
+
+class TestPartitions:
+    """Unit tests for the naming and ranges of the readings partitions
+    """
+    def test_partition_start(self):
+        ts = datetime.datetime(2017, 7, 14, 1, 30, 5, tzinfo=datetime.timezone(datetime.timedelta(hours=-5)))
+
+        assert partitions.partition_start(ts, 'hour') == _utc(2017, 7, 14, 6)
+        assert partitions.partition_start(ts, 'day') == _utc(2017, 7, 14)
+
+        with pytest.raises(ValueError):
+            partitions.partition_start(ts, 'fortnight')
+
+    def test_future_partitions(self):
+        """The current and the next premake periods are covered"""
+        result = partitions.future_partitions(_utc(2017, 7, 14, 13), 'day', 2)
+
+        assert result == [('readings_2017071400', _utc(2017, 7, 14), _utc(2017, 7, 15)),
+                          ('readings_2017071500', _utc(2017, 7, 15), _utc(2017, 7, 16)),
+                          ('readings_2017071600', _utc(2017, 7, 16), _utc(2017, 7, 17))]
+
+    def test_existing_partitions(self):
+        """Partitions start where the existing ones end, up to the next boundary of the unit"""
+        now = _utc(2017, 7, 14, 13)
+
+        assert partitions.future_partitions(now, 'day', 1, last_end=_utc(2017, 7, 14, 15)) == \
+            [('readings_2017071415', _utc(2017, 7, 14, 15), _utc(2017, 7, 15)),
+             ('readings_2017071500', _utc(2017, 7, 15), _utc(2017, 7, 16))]
+        assert partitions.future_partitions(now, 'hour', 1, last_end=_utc(2017, 7, 15)) == []
+        assert len(partitions.future_partitions(now, 'hour', 1, last_end=_utc(2017, 7, 1))) == 2
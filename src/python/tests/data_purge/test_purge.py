@@ -0,0 +1,179 @@
+# -*- coding: utf-8 -*-
+
+# FOGLAMP_BEGIN
+# See: http://foglamp.readthedocs.io/
+# FOGLAMP_END
+
+import time
+import pytest
+
+from foglamp.data_purge import purge
+
+__author__    = "Terris Linenbach"
+__copyright__ = "Copyright (c) 2017 OSIsoft, LLC"
+__license__   = "Apache 2.0"
+__version__   = "${VERSION}"
+
+
+class MockResult(object):
+    def __init__(self, rows):
+        self._rows = rows
+
+    async def fetchall(self):
+        return self._rows
+
+
+class MockConnection(object):
+    """Returns the next result of results for each statement it executes"""
+    def __init__(self, results):
+        self._results = list(results)
+        self.statements = []
+
+    async def execute(self, statement):
+        self.statements.append(statement)
+        return MockResult(self._results.pop(0) if self._results else [])
+
+
+class MockStoragePool(object):
+    """A started pool whose only connection is conn"""
+    def __init__(self, conn):
+        self._conn = conn
+
+    def acquire(self):
+        return self
+
+    async def __aenter__(self):
+        return self._conn
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        pass
+
+
+class TestGetLastSentId:
+    """Unit tests for get_last_sent_id
+    """
+    @pytest.mark.asyncio
+    async def test_active_streams(self):
+        """The lowest last_object of the active streams"""
+        conn = MockConnection([[(1998,)]])
+
+        assert await purge.get_last_sent_id(conn) == 1998
+        assert conn.statements == ["SELECT MIN(last_object) FROM foglamp.streams WHERE active"]
+
+    @pytest.mark.asyncio
+    async def test_no_active_stream(self):
+        """Nothing is sent when no stream is active"""
+        conn = MockConnection([[(None,)]])
+
+        assert await purge.get_last_sent_id(conn) == 0
+
+
+class TestDeleteInChunks:
+    """Unit tests for delete_in_chunks
+    """
+    @pytest.mark.asyncio
+    async def test_chunks(self):
+        """DELETEs are repeated until one removes less than a chunk"""
+        conn = MockConnection([[(1,), (2,)], [(3,), (4,)], [(5,)]])
+        table = purge._READING_TABLE
+
+        result = await purge.delete_in_chunks(conn, table, [table.c.ts <= '2017-01-01'], 10, 2, 0,
+                                              time.monotonic() + 60, 3)
+
+        assert result == (5, 2)
+        assert len(conn.statements) == 3
+        # Each chunk starts after the last id deleted, and ends at the upper id
+        params = conn.statements[2].compile().params
+        assert (params['id_1'], params['id_2']) == (4, 10)
+
+    @pytest.mark.asyncio
+    async def test_upper_id(self):
+        """No chunk starts once the upper id is deleted"""
+        conn = MockConnection([[(1,), (2,)], [(3,), (4,)]])
+        table = purge._READING_TABLE
+
+        assert await purge.delete_in_chunks(conn, table, [], 4, 2, 0, time.monotonic() + 60, 0) == (4, 4)
+        assert len(conn.statements) == 2
+
+    @pytest.mark.asyncio
+    async def test_time_budget(self):
+        """No chunk starts after the deadline"""
+        conn = MockConnection([[(1,), (2,)]])
+        table = purge._READING_TABLE
+
+        assert await purge.delete_in_chunks(conn, table, [], 10, 2, 0, time.monotonic() - 1, 0) == (0, 0)
+        assert conn.statements == []
+
+
+class TestDropExpiredPartitions:
+    """Unit tests for drop_expired_partitions
+    """
+    @staticmethod
+    def _connection():
+        return MockConnection([[(True,)], [('readings_2017010100',), ('readings_2017010200',)],
+                               [(1, 10, 10.0)], [], [],
+                               [(11, 20, -1.0)], [], []])
+
+    @pytest.mark.asyncio
+    async def test_estimates(self):
+        """Dropped rows are counted without scanning the partitions"""
+        conn = self._connection()
+
+        assert await purge.drop_expired_partitions(conn, '2017-01-03', 15, False) == (20, 5)
+        assert not any('count(' in str(statement) for statement in conn.statements)
+        assert conn.statements[-1] == "DROP TABLE foglamp.readings_2017010200"
+
+    @pytest.mark.asyncio
+    async def test_retain_unsent(self):
+        """The first partition holding an unsent row is kept, and the newer ones"""
+        conn = self._connection()
+
+        assert await purge.drop_expired_partitions(conn, '2017-01-03', 15, True) == (10, 0)
+        assert conn.statements[-1].startswith("SELECT min(id), max(id)")
+
+
+class TestPurge:
+    """Unit tests for purge
+    """
+    @pytest.mark.asyncio
+    async def test_remaining_counts(self):
+        """The rows left are counted in the range purged, and estimated above it from the ends of the ids"""
+        config = {'age': {'value': '72'}, 'retainUnsent': {'value': 'True'}, 'chunkSize': {'value': '100'},
+                  'chunkPause': {'value': '0'}, 'timeBudget': {'value': '60'}}
+        conn = MockConnection([[(10,)], [(False,)], [(id_,) for id_ in range(1, 9)], [(2, 0, 2)], [(9, 30)], []])
+
+        await purge.purge(conn, config)
+
+        remaining_query = conn.statements[3].compile()
+        # Only the range of ids purged is scanned, not every row under start_time
+        assert str(remaining_query).endswith('FROM readings \nWHERE readings.id <= :id_3')
+        assert remaining_query.params['id_3'] == 10
+        values = conn.statements[-1].compile().params
+        assert (values['total_rows_removed'], values['total_rows_remaining'], values['total_unsent_rows'],
+                values['total_failed_to_remove']) == (8, 22, 20, 2)
+
+
+class TestRun:
+    """Unit tests for run
+    """
+    @pytest.mark.asyncio
+    async def test_storage_pool(self, mocker):
+        """A purge borrows a connection from the pool it is given"""
+        async def configuration(*args):
+            return {}
+
+        purged = []
+
+        async def purge_readings(conn, config):
+            purged.append(conn)
+
+        mocker.patch.object(purge.configuration_manager, 'create_category', side_effect=configuration)
+        mocker.patch.object(purge.configuration_manager, 'get_category_all_items', side_effect=configuration)
+        mocker.patch.object(purge, 'purge', side_effect=purge_readings)
+        storage_pool_class = mocker.patch.object(purge, 'StoragePool')
+        conn = MockConnection([])
+
+        await purge.run(MockStoragePool(conn))
+
+        assert purged == [conn]
+        assert not storage_pool_class.called
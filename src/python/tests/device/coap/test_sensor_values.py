@@ -4,27 +4,22 @@
 # See: http://foglamp.readthedocs.io/
 # FOGLAMP_END
 
+import asyncio
+import json
+import os
 import pytest
 from unittest.mock import MagicMock
-from cbor2 import dumps
+from cbor2 import dumps, loads
 from aiocoap.numbers.codes import Code as CoAP_CODES
 
-from foglamp.device.coap.sensor_values import SensorValues
+from foglamp.device.coap.sensor_values import SensorValues, _SENSOR_VALUES_SCHEMA
 
 __author__    = "Terris Linenbach"
 __copyright__ = "Copyright (c) 2017 OSIsoft, LLC"
 __license__   = "Apache 2.0"
 __version__   = "${VERSION}"
 
-# TODO The functions and classes between this line
-# and the line marked END will be replaced by
-# mocks for the storage layer.
-#
-# Mock the following code:
-#
-#async with aiopg.sa.create_engine('...') as engine:
-#    async with engine.acquire() as conn:
-#        await conn.execute(...)
+
 def async_mock(*args, **kwargs):
     """Returns a coroutine that does nothing
     """
@@ -36,40 +31,13 @@ def async_mock(*args, **kwargs):
     return mock_coro
 
 
-class MockConnection(MagicMock):
-    """execute() returns a coroutine that does nothing
-    """
-    execute = async_mock()
-
-
-class AcquireContextManager(MagicMock):
-    """An async context manager that returns a MockConnection in __aenter__
-    """
-    async def __aenter__(self):
-        return MockConnection()
-
-    async def __aexit__(self, exc_type, exc_val, exc_tb):
-        pass
-
-
-class MockEngine(MagicMock):
-    """aquire() returns a AcquireContextManager object
+class MockIngest(MagicMock):
+    """add_reading() and add_readings() return coroutines that do nothing
     """
-    acquire = AcquireContextManager()
+    add_reading = async_mock()
 
-
-class CreateEngineContextManager(MagicMock):
-    """An async context manager that returns a MockEngine in __aenter__
-    """
-    async def __aenter__(self):
-        return MockEngine()
-
-    async def __aexit__(self, exc_type, exc_val, exc_tb):
-        pass
-
-def _mock_create_engine(mocker):
-    mocker.patch('aiopg.sa.create_engine', return_value=CreateEngineContextManager())
-# END
+    async def add_readings(self, readings):
+        return [None] * len(readings)
 
 
 class TestSensorValues:
@@ -80,6 +48,9 @@ class TestSensorValues:
         ('hello world', CoAP_CODES.BAD_REQUEST),
         ({'asset':'test'}, CoAP_CODES.BAD_REQUEST),
         ({'timestamp':'2017-01-01T00:00:00Z'}, CoAP_CODES.BAD_REQUEST),
+        ({'timestamp':'2017-01-01T00:00:00Z', 'asset':1}, CoAP_CODES.BAD_REQUEST),
+        ({'timestamp':'2017-01-01T00:00:00Z', 'asset':'test', 'sensor_values':1}, CoAP_CODES.BAD_REQUEST),
+        ({'timestamp':'2017-01-01T00:00:00Z', 'asset':'test', 'unknown':1}, CoAP_CODES.BAD_REQUEST),
         ({'timestamp':'2017-01-01T00:00:00Z', 'asset':'test'}, CoAP_CODES.VALID)
     ]
     """An array of tuples consisting of (payload, expected status code)
@@ -89,10 +60,63 @@ class TestSensorValues:
     @pytest.mark.asyncio
     async def test_payload(self, mocker, dict_payload, expected):
         """Runs all test cases in the __requests array"""
-        _mock_create_engine(mocker)
-        sv = SensorValues()
+        sv = SensorValues(MockIngest())
         request = MagicMock()
         request.payload = dumps(dict_payload)
         return_val = await sv.render_post(request)
         assert return_val.code == expected
 
+
+    __batch_requests = [
+        ([], CoAP_CODES.BAD_REQUEST, []),
+        ([{'asset': 'test'}], CoAP_CODES.BAD_REQUEST, [False]),
+        ([{'timestamp': '2017-01-01T00:00:00Z', 'asset': 'test'},
+          'hello world',
+          {'timestamp': '2017-01-01T00:00:00Z', 'asset': 'test', 'sensor_values': {'x': 1}}],
+         CoAP_CODES.VALID, [True, False, True])
+    ]
+    """An array of tuples consisting of (array payload, expected status code, expected acceptance)
+    """
+
+    @pytest.mark.parametrize("list_payload, expected, accepted", __batch_requests)
+    @pytest.mark.asyncio
+    async def test_batch_payload(self, list_payload, expected, accepted):
+        """Runs all test cases in the __batch_requests array"""
+        sv = SensorValues(MockIngest())
+        request = MagicMock()
+        request.payload = dumps(list_payload)
+        return_val = await sv.render_post(request)
+        assert return_val.code == expected
+        assert loads(return_val.payload) == accepted
+
+    @pytest.mark.asyncio
+    async def test_too_many_readings(self):
+        """An array longer than max_readings is answered with 4.13"""
+        sv = SensorValues(MockIngest(), max_readings=2)
+        request = MagicMock()
+        request.payload = dumps([{'timestamp': '2017-01-01T00:00:00Z', 'asset': 'test'}] * 3)
+        return_val = await sv.render_post(request)
+        assert return_val.code == CoAP_CODES.REQUEST_ENTITY_TOO_LARGE
+
+    def test_schema(self):
+        """The compiled schema matches src/json-schema/sensor-values.json"""
+        path = os.path.join(os.path.dirname(__file__), '..', '..', '..', '..', 'json-schema',
+                            ' sensor-values.json')
+        with open(path) as file:
+            assert json.load(file) == _SENSOR_VALUES_SCHEMA
+
+    @pytest.mark.asyncio
+    async def test_busy(self):
+        """A full ingest buffer is answered with 5.03 and Max-Age"""
+        ingest = MockIngest()
+
+        async def add_reading(**kwargs):
+            raise asyncio.QueueFull()
+
+        ingest.add_reading = add_reading
+        sv = SensorValues(ingest, busy_max_age=7)
+        request = MagicMock()
+        request.payload = dumps({'timestamp': '2017-01-01T00:00:00Z', 'asset': 'test'})
+        return_val = await sv.render_post(request)
+        assert return_val.code == CoAP_CODES.SERVICE_UNAVAILABLE
+        assert return_val.opt.max_age == 7
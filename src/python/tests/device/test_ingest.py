@@ -0,0 +1,322 @@
+# -*- coding: utf-8 -*-
+
+# FOGLAMP_BEGIN
+# See: http://foglamp.readthedocs.io/
+# FOGLAMP_END
+
+import asyncio
+import pytest
+from unittest.mock import MagicMock
+
+from foglamp.device.ingest import Ingest
+from foglamp.device.spool import Spool
+
+__author__    = "Terris Linenbach"
+__copyright__ = "Copyright (c) 2017 OSIsoft, LLC"
+__license__   = "Apache 2.0"
+__version__   = "${VERSION}"
+
+
+class MockConnection(object):
+    """Records the statements passed to execute()
+    """
+    def __init__(self, pool):
+        self._pool = pool
+
+    async def execute(self, statement):
+        if self._pool.error is not None:
+            raise self._pool.error
+        self._pool.statements.append(statement)
+
+        # Every reading is new unless its key was inserted before
+        rows = statement.parameters if isinstance(statement.parameters, list) else [statement.parameters]
+        result = MagicMock()
+        result.rowcount = 0
+        for row in rows:
+            key = row['read_key']
+            if key is None or key not in self._pool.keys:
+                self._pool.keys.add(key)
+                result.rowcount += 1
+        return result
+
+
+class AcquireContextManager(object):
+    """An async context manager that returns a MockConnection in __aenter__
+    """
+    def __init__(self, pool):
+        self._pool = pool
+
+    async def __aenter__(self):
+        return MockConnection(self._pool)
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        pass
+
+
+class MockStoragePool(MagicMock):
+    """acquire() returns an AcquireContextManager object
+    """
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.statements = []
+        self.keys = set()
+        self.error = None
+
+    def acquire(self):
+        return AcquireContextManager(self)
+
+
+def _add_readings(ingest, count, key=None):
+    return [asyncio.ensure_future(ingest.add_reading(
+        asset_code='test', timestamp='2017-01-01T00:00:00Z', key=key, readings={'x': i}))
+        for i in range(count)]
+
+
+async def _wait_until_drained(spool):
+    for _ in range(100):
+        if not len(spool):
+            return
+        await asyncio.sleep(0.01)
+
+
+class TestIngest:
+    """Unit tests for Ingest
+    """
+    @pytest.mark.asyncio
+    async def test_batch_size(self):
+        """A full batch is inserted without waiting for the timer"""
+        pool = MockStoragePool()
+        ingest = Ingest(pool, max_batch_size=10, max_batch_wait_ms=60000)
+        ingest.start()
+
+        await asyncio.wait_for(asyncio.gather(*_add_readings(ingest, 20)), 1)
+
+        assert len(pool.statements) == 2
+        statistics = ingest.get_statistics()
+        assert statistics['readings_inserted'] == 20
+        assert statistics['batches_inserted'] == 2
+
+        await ingest.stop()
+
+    @pytest.mark.asyncio
+    async def test_batch_wait(self):
+        """A partial batch is inserted when the timer expires"""
+        pool = MockStoragePool()
+        ingest = Ingest(pool, max_batch_size=100, max_batch_wait_ms=10)
+        ingest.start()
+
+        await asyncio.wait_for(asyncio.gather(*_add_readings(ingest, 3)), 1)
+
+        assert len(pool.statements) == 1
+        assert ingest.get_statistics()['readings_inserted'] == 3
+
+        await ingest.stop()
+
+    @pytest.mark.asyncio
+    async def test_add_readings(self):
+        """Readings added together are inserted by one statement"""
+        pool = MockStoragePool()
+        ingest = Ingest(pool, max_batch_size=10, max_batch_wait_ms=60000)
+        ingest.start()
+
+        readings = [{'asset_code': 'test', 'timestamp': '2017-01-01T00:00:00Z', 'readings': {'x': i}}
+                    for i in range(10)]
+        results = await asyncio.wait_for(ingest.add_readings(readings), 1)
+
+        assert results == [None] * 10
+        assert len(pool.statements) == 1
+
+        await ingest.stop()
+
+    @pytest.mark.asyncio
+    async def test_duplicates(self):
+        """Duplicate keys are counted, not raised"""
+        pool = MockStoragePool()
+        ingest = Ingest(pool, max_batch_size=3, max_batch_wait_ms=60000)
+        ingest.start()
+
+        await asyncio.wait_for(asyncio.gather(*_add_readings(ingest, 3, key='k')), 1)
+
+        statistics = ingest.get_statistics()
+        assert statistics['readings_inserted'] == 1
+        assert statistics['duplicates_dropped'] == 2
+
+        await ingest.stop()
+
+    @pytest.mark.asyncio
+    async def test_recent_keys(self):
+        """Keys of committed readings are dropped before they reach the database"""
+        pool = MockStoragePool()
+        ingest = Ingest(pool, max_batch_size=1, max_batch_wait_ms=60000, recent_keys_size=2)
+        ingest.start()
+
+        for key in ('a', 'b', 'a', 'c', 'a'):
+            await asyncio.wait_for(ingest.add_reading(
+                asset_code='test', timestamp='2017-01-01T00:00:00Z', key=key), 1)
+
+        statistics = ingest.get_statistics()
+        assert statistics['recent_duplicates_dropped'] == 1
+        assert statistics['duplicates_dropped'] == 1
+        assert statistics['recent_keys'] == 2
+        assert len(pool.statements) == 4
+
+        await ingest.stop()
+
+    @pytest.mark.asyncio
+    async def test_max_buffered(self):
+        """Readings above the high-water mark are rejected"""
+        pool = MockStoragePool()
+        ingest = Ingest(pool, max_batch_size=100, max_batch_wait_ms=60000, max_buffered=2)
+        ingest.start()
+
+        futures = _add_readings(ingest, 2)
+        await asyncio.sleep(0)
+
+        with pytest.raises(asyncio.QueueFull):
+            await ingest.add_reading(asset_code='test', timestamp='2017-01-01T00:00:00Z')
+
+        with pytest.raises(asyncio.QueueFull):
+            await ingest.add_readings([{'asset_code': 'test', 'timestamp': '2017-01-01T00:00:00Z'}] * 3)
+
+        assert ingest.get_statistics()['readings_rejected'] == 4
+
+        await ingest.stop()
+        await asyncio.gather(*futures)
+
+    @pytest.mark.asyncio
+    async def test_max_buffered_array(self):
+        """An array that would take the buffer above the high-water mark is rejected"""
+        pool = MockStoragePool()
+        ingest = Ingest(pool, max_batch_size=100, max_batch_wait_ms=60000, max_buffered=2)
+        ingest.start()
+
+        with pytest.raises(asyncio.QueueFull):
+            await ingest.add_readings([{'asset_code': 'test', 'timestamp': '2017-01-01T00:00:00Z'}] * 3)
+
+        assert ingest.get_statistics()['readings_rejected'] == 3
+
+        await ingest.stop()
+
+    @pytest.mark.asyncio
+    async def test_stop_inserts_buffered_readings(self):
+        pool = MockStoragePool()
+        ingest = Ingest(pool, max_batch_size=100, max_batch_wait_ms=60000)
+        ingest.start()
+
+        futures = _add_readings(ingest, 5)
+        await asyncio.sleep(0)
+        await ingest.stop()
+        await asyncio.gather(*futures)
+
+        assert ingest.get_statistics()['readings_inserted'] == 5
+
+    @pytest.mark.asyncio
+    async def test_insert_failure(self):
+        """Every reading in a failed batch gets the exception"""
+        pool = MockStoragePool()
+        pool.error = ConnectionError()
+        ingest = Ingest(pool, max_batch_size=2, max_batch_wait_ms=60000)
+        ingest.start()
+
+        results = await asyncio.gather(*_add_readings(ingest, 2), return_exceptions=True)
+
+        assert all(isinstance(result, ConnectionError) for result in results)
+        assert ingest.get_statistics()['insert_failures'] == 1
+
+        await ingest.stop()
+
+    @pytest.mark.asyncio
+    async def test_insert_failure_logged_once(self, mocker):
+        """The traceback is logged for the first failed batch of an outage only"""
+        logger = mocker.patch('foglamp.device.ingest.logging.getLogger').return_value
+        pool = MockStoragePool()
+        pool.error = ConnectionError()
+        ingest = Ingest(pool, max_batch_size=1, max_batch_wait_ms=60000)
+        ingest.start()
+
+        await asyncio.gather(*_add_readings(ingest, 3), return_exceptions=True)
+
+        assert logger.exception.call_count == 1
+        assert logger.warning.call_count == 2
+
+        pool.error = None
+        await asyncio.gather(*_add_readings(ingest, 1))
+        pool.error = ConnectionError()
+        await asyncio.gather(*_add_readings(ingest, 1), return_exceptions=True)
+
+        assert logger.exception.call_count == 2
+
+        await ingest.stop()
+
+    @pytest.mark.asyncio
+    async def test_spool(self, tmpdir):
+        """Readings are spooled while the database is unavailable and inserted later"""
+        pool = MockStoragePool()
+        pool.error = ConnectionError()
+        spool = Spool(str(tmpdir.join('readings.spool')), size=65536)
+        spool.open()
+        ingest = Ingest(pool, max_batch_size=2, max_batch_wait_ms=60000, spool=spool, spool_retry_seconds=0.01)
+        ingest.start()
+
+        await asyncio.wait_for(asyncio.gather(*_add_readings(ingest, 2)), 1)
+        assert len(spool) == 2
+
+        pool.error = None
+        await _wait_until_drained(spool)
+
+        statistics = ingest.get_statistics()
+        assert statistics['readings_spooled'] == 2
+        assert statistics['spooled_readings_inserted'] == 2
+
+        await ingest.stop()
+        spool.close()
+
+    @pytest.mark.asyncio
+    async def test_spool_flush_interval(self, tmpdir):
+        """The last spooled readings are flushed once the fsync interval passes, without another append"""
+        pool = MockStoragePool()
+        pool.error = ConnectionError()
+        spool = Spool(str(tmpdir.join('readings.spool')), size=65536, fsync_policy='interval',
+                      fsync_interval=0.05)
+        spool.open()
+        ingest = Ingest(pool, max_batch_size=2, max_batch_wait_ms=60000, spool=spool, spool_retry_seconds=60)
+        ingest.start()
+        spool.flush()
+
+        # One append, within the fsync interval of the last flush
+        await asyncio.wait_for(asyncio.gather(*_add_readings(ingest, 2)), 1)
+        assert spool.get_statistics()['flushes'] == 0
+
+        for _ in range(20):
+            await asyncio.sleep(0.02)
+        assert spool.get_statistics()['flushes'] == 1
+
+        await ingest.stop()
+        spool.close()
+
+    @pytest.mark.asyncio
+    async def test_spool_saturated(self, tmpdir):
+        """Readings above max_buffered are spooled instead of rejected"""
+        pool = MockStoragePool()
+        spool = Spool(str(tmpdir.join('readings.spool')), size=65536)
+        spool.open()
+        ingest = Ingest(pool, max_batch_size=2, max_batch_wait_ms=60000, max_buffered=0,
+                        spool=spool, spool_retry_seconds=0.01)
+        ingest.start()
+
+        await ingest.add_reading(asset_code='test', timestamp='2017-01-01T00:00:00Z')
+        await _wait_until_drained(spool)
+
+        statistics = ingest.get_statistics()
+        assert statistics['readings_rejected'] == 0
+        assert statistics['readings_inserted'] == 1
+
+        await ingest.stop()
+        spool.close()
+
+    @pytest.mark.asyncio
+    async def test_not_started(self):
+        ingest = Ingest(MockStoragePool())
+
+        with pytest.raises(RuntimeError):
+            await ingest.add_reading(asset_code='test', timestamp='2017-01-01T00:00:00Z')
@@ -0,0 +1,68 @@
+# -*- coding: utf-8 -*-
+
+# FOGLAMP_BEGIN
+# See: http://foglamp.readthedocs.io/
+# FOGLAMP_END
+
+import os
+import signal
+import threading
+import time
+import pytest
+
+from foglamp.device import server
+from foglamp.device.coap import controller
+
+__author__    = "Terris Linenbach"
+__copyright__ = "Copyright (c) 2017 OSIsoft, LLC"
+__license__   = "Apache 2.0"
+__version__   = "${VERSION}"
+
+
+class TestSupervisor:
+    """Unit tests for the worker supervisor
+    """
+    def test_restart(self, mocker, tmpdir):
+        """Workers that exit are restarted until the supervisor stops"""
+        started = tmpdir.join('started')
+
+        def serve(loop, worker_id):
+            with open(str(started), 'a') as file:
+                file.write('{}\n'.format(worker_id))
+            time.sleep(0.05)
+
+        mocker.patch.object(server, '_serve', side_effect=serve)
+        mocker.patch.object(server, '_RESTART_DELAY_SECONDS', 0.01)
+        handlers = {signal_name: signal.getsignal(signal_name) for signal_name in server._STOP_SIGNALS}
+
+        supervisor = server._Supervisor(2)
+        threading.Timer(0.5, supervisor._stop, (signal.SIGTERM, None)).start()
+
+        try:
+            supervisor.run()
+        finally:
+            for signal_name, handler in handlers.items():
+                signal.signal(signal_name, handler)
+            os.environ.pop('AIOCOAP_REUSE_PORT', None)
+
+        worker_ids = started.read().split()
+        assert set(worker_ids) == {'0', '1'}
+        assert len(worker_ids) > 2
+
+
+class TestStart:
+    """Unit tests for start
+    """
+    def test_workers_without_reuse_port(self, mocker):
+        """Several workers are refused when aiocoap cannot share the port"""
+        async def read_config():
+            return {'workers': {'value': '2'}}
+
+        mocker.patch.object(controller, 'read_config', side_effect=read_config)
+        mocker.patch.object(server, '_reuse_port_supported', return_value=False)
+        supervisor_class = mocker.patch.object(server, '_Supervisor')
+
+        with pytest.raises(RuntimeError):
+            server.start()
+
+        assert not supervisor_class.called
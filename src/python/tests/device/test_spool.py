@@ -0,0 +1,109 @@
+# -*- coding: utf-8 -*-
+
+# FOGLAMP_BEGIN
+# See: http://foglamp.readthedocs.io/
+# FOGLAMP_END
+
+import asyncio
+import pytest
+
+from foglamp.device.spool import Spool
+
+__author__    = "Terris Linenbach"
+__copyright__ = "Copyright (c) 2017 OSIsoft, LLC"
+__license__   = "Apache 2.0"
+__version__   = "${VERSION}"
+
+
+def _readings(count, start=0):
+    return [{'asset_code': 'test', 'read_key': None, 'user_ts': '2017-01-01T00:00:00Z',
+             'reading': {'x': i}} for i in range(start, start + count)]
+
+
+class TestSpool:
+    """Unit tests for Spool
+    """
+    def test_peek_consume(self, tmpdir):
+        """Readings come out in the order they were spooled"""
+        spool = Spool(str(tmpdir.join('readings.spool')), size=4096)
+        spool.open()
+
+        spool.append(_readings(2))
+        spool.append(_readings(2, start=2))
+        assert len(spool) == 4
+
+        readings, length = spool.peek(3)
+        assert [reading['reading']['x'] for reading in readings] == [0, 1, 2, 3]
+
+        spool.consume(length, len(readings))
+        assert len(spool) == 0
+        assert spool.peek(3) == ([], 0)
+
+        spool.close()
+
+    def test_recover(self, tmpdir):
+        """Unconsumed readings survive reopening the spool"""
+        path = str(tmpdir.join('spool', 'readings.spool'))
+        spool = Spool(path, size=4096, fsync_policy='always')
+        spool.open()
+        spool.append(_readings(1))
+        spool.append(_readings(1, start=1))
+        readings, length = spool.peek(1)
+        spool.consume(length, len(readings))
+        spool.close()
+
+        spool = Spool(path, size=4096)
+        spool.open()
+        readings, _ = spool.peek(10)
+        assert [reading['reading']['x'] for reading in readings] == [1]
+        spool.close()
+
+    def test_recover_torn_record(self, tmpdir):
+        """A record that does not decode is discarded with the ones after it"""
+        path = str(tmpdir.join('readings.spool'))
+        spool = Spool(path, size=4096, fsync_policy='always')
+        spool.open()
+        spool.append(_readings(1))
+        _, length = spool.peek(1)
+        spool.append(_readings(1, start=1))
+        spool.close()
+
+        # The header was written but not the second record
+        with open(path, 'r+b') as file:
+            file.seek(16 + length + 4)
+            file.write(b'\xff' * 8)
+
+        spool = Spool(path, size=4096)
+        spool.open()
+        assert len(spool) == 1
+        assert spool.get_statistics()['used'] == length
+        spool.append(_readings(1, start=2))
+        readings, _ = spool.peek(10)
+        assert [reading['reading']['x'] for reading in readings] == [0, 2]
+        spool.close()
+
+    def test_full(self, tmpdir):
+        """Consumed space is reused and a full spool rejects readings"""
+        spool = Spool(str(tmpdir.join('readings.spool')), size=512, fsync_policy='never')
+        spool.open()
+
+        appended = 0
+        with pytest.raises(asyncio.QueueFull):
+            while True:
+                spool.append(_readings(1, start=appended))
+                appended += 1
+
+        assert spool.get_statistics()['readings_rejected'] == 1
+
+        readings, length = spool.peek(1)
+        spool.consume(length, len(readings))
+        spool.append(_readings(1, start=appended))
+
+        readings, _ = spool.peek(appended)
+        assert [reading['reading']['x'] for reading in readings] == list(range(1, appended + 1))
+
+        spool.close()
+
+    def test_invalid_policy(self, tmpdir):
+        with pytest.raises(ValueError):
+            Spool(str(tmpdir.join('readings.spool')), fsync_policy='sometimes')
@@ -0,0 +1,51 @@
+# -*- coding: utf-8 -*-
+
+# FOGLAMP_BEGIN
+# See: http://foglamp.readthedocs.io/
+# FOGLAMP_END
+
+import pytest
+
+from foglamp.json_schema import compile_schema
+
+__author__    = "Terris Linenbach"
+__copyright__ = "Copyright (c) 2017 OSIsoft, LLC"
+__license__   = "Apache 2.0"
+__version__   = "${VERSION}"
+
+
+class TestJsonSchema:
+    """Unit tests for compile_schema
+    """
+    __schema = {
+        "type": "object",
+        "properties": {
+            "name": {"type": "string"},
+            "count": {"type": "integer"},
+            "values": {"type": "object", "additionalProperties": {"type": "number"}}
+        },
+        "required": ["name"],
+        "additionalProperties": False
+    }
+
+    __instances = [
+        ({'name': 'a'}, True),
+        ({'name': 'a', 'count': 1, 'values': {'x': 1.5, 'y': 2}}, True),
+        ([], False),
+        ({}, False),
+        ({'name': 1}, False),
+        ({'name': 'a', 'count': True}, False),
+        ({'name': 'a', 'values': {'x': 'high'}}, False),
+        ({'name': 'a', 'other': 1}, False)
+    ]
+    """An array of tuples consisting of (instance, expected validity)
+    """
+
+    @pytest.mark.parametrize("instance, valid", __instances)
+    def test_validate(self, instance, valid):
+        validate = compile_schema(self.__schema)
+        assert (validate(instance) is None) == valid
+
+    def test_unsupported_type(self):
+        with pytest.raises(ValueError):
+            compile_schema({"type": "date"})
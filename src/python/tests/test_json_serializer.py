@@ -0,0 +1,48 @@
+# -*- coding: utf-8 -*-
+
+# FOGLAMP_BEGIN
+# See: http://foglamp.readthedocs.io/
+# FOGLAMP_END
+
+import json
+import pytest
+
+from foglamp import json_serializer
+
+__author__    = "Terris Linenbach"
+__copyright__ = "Copyright (c) 2017 OSIsoft, LLC"
+__license__   = "Apache 2.0"
+__version__   = "${VERSION}"
+
+
+class TestJsonSerializer:
+    """Unit tests for json_serializer
+    """
+    __values = [
+        {'Time': '2017-01-01T00:00:00', 'x': 1.5, 'y': -2, 'button': 'down'},
+        [{'containerid': 'measurement_mouse', 'values': [{'Time': '2017-01-01T00:00:00', 'lux': 320}]}],
+        {'name': 'café', 'nested': {'list': [1, None, True, False]}},
+        {'big': 2 ** 70, 'bigger': 123456789012345678901234567890, 'negative': -(2 ** 63) - 1}
+    ]
+
+    @pytest.fixture(params=['library', 'json'])
+    def serializer(self, request, mocker):
+        """Runs each test with the library installed and with the standard json module"""
+        if request.param == 'json':
+            mocker.patch.object(json_serializer, '_orjson', None)
+        return json_serializer
+
+    def test_dumps(self, serializer):
+        for value in self.__values:
+            text = serializer.dumps(value)
+            assert isinstance(text, str)
+            assert json.loads(text) == value
+
+    def test_loads(self, serializer):
+        for value in self.__values:
+            assert serializer.loads(json.dumps(value)) == value
+            assert serializer.loads(json.dumps(value).encode('utf-8')) == value
+
+    def test_invalid(self, serializer):
+        with pytest.raises(ValueError):
+            serializer.loads('{"x": ')
@@ -0,0 +1,104 @@
+# -*- coding: utf-8 -*-
+
+# FOGLAMP_BEGIN
+# See: http://foglamp.readthedocs.io/
+# FOGLAMP_END
+
+import asyncio
+import pytest
+from unittest.mock import MagicMock
+
+from foglamp.storage_pool import StoragePool
+
+__author__    = "Terris Linenbach"
+__copyright__ = "Copyright (c) 2017 OSIsoft, LLC"
+__license__   = "Apache 2.0"
+__version__   = "${VERSION}"
+
+
+class MockEngine(object):
+    """A pool of max_size connections that never touches a database
+    """
+    def __init__(self, max_size):
+        self._free = asyncio.Queue()
+        for _ in range(max_size):
+            self._free.put_nowait(MagicMock())
+        self.size = max_size
+        self.closed = False
+
+    @property
+    def freesize(self):
+        return self._free.qsize()
+
+    async def acquire(self):
+        return await self._free.get()
+
+    async def release(self, conn):
+        self._free.put_nowait(conn)
+
+    def close(self):
+        self.closed = True
+
+    async def wait_closed(self):
+        pass
+
+
+def _mock_create_engine(mocker, max_size):
+    engine = MockEngine(max_size)
+
+    async def create_engine(*args, **kwargs):
+        return engine
+
+    mocker.patch('aiopg.sa.create_engine', side_effect=create_engine)
+
+
+class TestStoragePool:
+    """Unit tests for StoragePool
+    """
+    @pytest.mark.asyncio
+    async def test_statistics(self, mocker):
+        """Connections in use are counted while acquired"""
+        _mock_create_engine(mocker, 2)
+        pool = StoragePool(min_size=1, max_size=2)
+        await pool.start()
+
+        async with pool.acquire():
+            statistics = pool.get_statistics()
+            assert statistics['in_use'] == 1
+            assert statistics['waiters'] == 0
+
+        statistics = pool.get_statistics()
+        assert statistics['in_use'] == 0
+        assert statistics['acquired'] == 1
+
+        await pool.stop()
+        assert pool.get_statistics()['size'] == 0
+
+    @pytest.mark.asyncio
+    async def test_acquire_timeout(self, mocker):
+        """Acquire raises TimeoutError when all connections stay in use"""
+        _mock_create_engine(mocker, 1)
+        pool = StoragePool(max_size=1, acquire_timeout=0.01)
+        await pool.start()
+
+        async with pool.acquire():
+            with pytest.raises(asyncio.TimeoutError):
+                async with pool.acquire():
+                    pass
+
+        statistics = pool.get_statistics()
+        assert statistics['acquire_timeouts'] == 1
+        assert statistics['waiters'] == 0
+
+        await pool.stop()
+
+    @pytest.mark.asyncio
+    async def test_start_twice(self, mocker):
+        _mock_create_engine(mocker, 1)
+        pool = StoragePool()
+        await pool.start()
+
+        with pytest.raises(RuntimeError):
+            await pool.start()
+
+        await pool.stop()
@@ -0,0 +1,478 @@
+# -*- coding: utf-8 -*-
+
+# FOGLAMP_BEGIN
+# See: http://foglamp.readthedocs.io/
+# FOGLAMP_END
+
+import asyncio
+import collections
+import datetime
+import gzip
+import json
+import pytest
+
+from foglamp.translators import omf_translator
+
+__author__    = "Terris Linenbach"
+__copyright__ = "Copyright (c) 2017 OSIsoft, LLC"
+__license__   = "Apache 2.0"
+__version__   = "${VERSION}"
+
+
+def _container_values(containers, values_per_container):
+    return collections.OrderedDict(
+        ('measurement_{}'.format(c), [json.dumps({'Time': '2017-01-01T00:00:00', 'x': v})
+                                      for v in range(values_per_container)])
+        for c in range(containers))
+
+
+def _decoded_values(messages):
+    values = collections.OrderedDict()
+    for message in messages:
+        for entry in json.loads(message):
+            values.setdefault(entry['containerid'], []).extend(entry['values'])
+    return values
+
+
+class TestCreateDataMessages:
+    """Unit tests for create_data_messages
+    """
+    def test_one_message(self):
+        """All the containers of a block fit in one message"""
+        container_values = _container_values(3, 5)
+        messages = omf_translator.create_data_messages(container_values, 100000)
+
+        assert len(messages) == 1
+        assert len(json.loads(messages[0])) == 3
+        assert _decoded_values(messages) == {container_id: [json.loads(value) for value in values]
+                                             for container_id, values in container_values.items()}
+
+    def test_split(self):
+        """Messages stay under the maximum size and keep every value in order"""
+        container_values = _container_values(3, 50)
+        messages = omf_translator.create_data_messages(container_values, 500)
+
+        assert len(messages) > 1
+        assert all(len(message) <= 500 for message in messages)
+        assert _decoded_values(messages) == {container_id: [json.loads(value) for value in values]
+                                             for container_id, values in container_values.items()}
+
+    def test_large_value(self):
+        """A value larger than the maximum size is sent alone"""
+        container_values = _container_values(1, 3)
+        messages = omf_translator.create_data_messages(container_values, 10)
+
+        assert len(messages) == 3
+
+    def test_first_ids(self):
+        """Each message comes with the lowest id of its rows"""
+        container_values = _container_values(2, 50)
+        container_ids = {'measurement_0': list(range(0, 100, 2)), 'measurement_1': list(range(1, 100, 2))}
+
+        messages = omf_translator.create_data_messages(container_values, 1000, container_ids)
+
+        assert [message for message, _ in messages] == \
+            omf_translator.create_data_messages(container_values, 1000)
+        for message, first_id in messages:
+            # The x of a value is its index in the values of its container
+            assert first_id == min(container_ids[container_id][values[0]['x']]
+                                   for container_id, values in _decoded_values([message]).items())
+
+
+class TestSendDataMessage:
+    """Unit tests for send_data_message
+    """
+    @pytest.mark.asyncio
+    async def test_retry(self, mocker):
+        """A failed message is sent again after a growing random delay"""
+        attempts = []
+
+        async def send(stream, message_type, omf_data, readings_message=False):
+            attempts.append(omf_data)
+            if len(attempts) < 3:
+                raise Exception("relay unavailable")
+
+        async def sleep(delay):
+            delays.append(delay)
+
+        delays = []
+        mocker.patch.object(omf_translator, 'send_omf_message_to_end_point', side_effect=send)
+        mocker.patch.object(omf_translator.asyncio, 'sleep', side_effect=sleep)
+        mocker.patch.object(omf_translator, '_retry_initial_delay', 1)
+        mocker.patch.object(omf_translator, '_retry_max_delay', 1.5)
+        mocker.patch.object(omf_translator, '_log')
+
+        await omf_translator.send_data_message(None, '[]')
+
+        assert attempts == ['[]'] * 3
+        assert 0 <= delays[0] <= 1
+        assert 0 <= delays[1] <= 1.5
+
+    @pytest.mark.asyncio
+    async def test_give_up(self, mocker):
+        """The last failure is raised after _retry_attempts attempts"""
+        send = mocker.patch.object(omf_translator, 'send_omf_message_to_end_point',
+                                   side_effect=Exception("relay unavailable"))
+        mocker.patch.object(omf_translator, '_retry_attempts', 2)
+        mocker.patch.object(omf_translator, '_retry_initial_delay', 0)
+        mocker.patch.object(omf_translator, '_log')
+
+        with pytest.raises(Exception):
+            await omf_translator.send_data_message(None, '[]')
+
+        assert send.call_count == 2
+
+
+    @pytest.mark.parametrize("status, attempts", [(None, 3), (500, 3), (429, 3), (408, 3), (400, 1), (404, 1)])
+    @pytest.mark.asyncio
+    async def test_transient(self, mocker, status, attempts):
+        """Only failures without a response, 5xx, 408 and 429 are sent again"""
+        send = mocker.patch.object(omf_translator, 'send_omf_message_to_end_point',
+                                   side_effect=omf_translator.OmfRequestError("rejected", status))
+        mocker.patch.object(omf_translator, '_retry_attempts', 3)
+        mocker.patch.object(omf_translator, '_retry_initial_delay', 0)
+        mocker.patch.object(omf_translator, '_log')
+
+        with pytest.raises(omf_translator.OmfRequestError):
+            await omf_translator.send_data_message(None, '[]')
+
+        assert send.call_count == attempts
+
+
+class TestSendBlock:
+    """Unit tests for send_block
+    """
+    @pytest.mark.asyncio
+    async def test_partial(self, mocker):
+        """Rows are acknowledged up to the first row of the lowest failed message"""
+        Row = collections.namedtuple('Row', 'id asset_code user_ts reading')
+        rows = [Row(row_id, 'mouse' if row_id % 2 else 'TI sensorTag/luxometer',
+                    datetime.datetime(2017, 1, 1), {'button': 'down', 'lux': 1}) for row_id in range(1, 9)]
+
+        async def send_data_message(stream, data_message):
+            if 'measurement_mouse' in data_message:
+                raise Exception("relay unavailable")
+
+        omf_translator.initialize_plugin()
+        mocker.patch.object(omf_translator, 'omf_object_creation')
+        mocker.patch.object(omf_translator, 'send_data_message', side_effect=send_data_message)
+        mocker.patch.object(omf_translator, '_max_message_size', 200)
+        mocker.patch.object(omf_translator, '_LOG_SCREEN', False)
+        mocker.patch.object(omf_translator, '_log')
+
+        assert await omf_translator.send_block(None, rows[1:2]) == (2, 1)
+        acknowledged_position, data_messages = await omf_translator.send_block(None, rows)
+        assert acknowledged_position is None
+        assert data_messages > 2
+        assert (await omf_translator.send_block(None, rows[1:]))[0] == 2
+
+
+class TestCompressOmfMessage:
+    """Unit tests for compress_omf_message
+    """
+    def test_not_compressed(self, mocker):
+        mocker.patch.object(omf_translator, '_compression', None)
+
+        assert omf_translator.compress_omf_message('[]') == ('[]', None)
+
+    @pytest.mark.parametrize("level", [1, 9])
+    def test_gzip(self, mocker, level):
+        """The body decompresses to the message and is smaller than it"""
+        mocker.patch.object(omf_translator, '_compression', "gzip")
+        mocker.patch.object(omf_translator, '_compression_level', level)
+        message = omf_translator.create_data_messages(_container_values(3, 50), 100000)[0]
+
+        body, compression = omf_translator.compress_omf_message(message)
+
+        assert compression == "gzip"
+        assert gzip.decompress(body).decode("utf-8") == message
+        assert len(body) < len(message)
+
+    def test_unsupported(self, mocker):
+        mocker.patch.object(omf_translator, '_compression', "brotli")
+
+        with pytest.raises(ValueError):
+            omf_translator.compress_omf_message('[]')
+
+
+class MockEngine(object):
+    """An async context manager whose acquire() is one too"""
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        pass
+
+    def acquire(self):
+        return self
+
+
+class MockResult(object):
+    def __init__(self, rows):
+        self._rows = rows
+        self.returns_rows = rows is not None
+
+    async def fetchall(self):
+        return self._rows
+
+
+class MockConnection(object):
+    """Records the statements it executes and returns no row"""
+    def __init__(self):
+        self.statements = []
+
+    async def execute(self, statement, **params):
+        self.statements.append((statement, params))
+        return MockResult(None if statement.split()[0] in ('INSERT', 'UPDATE', 'DELETE') else [])
+
+
+def _connected_stream(conn):
+    stream = omf_translator.OmfStream(7, 'http://localhost/omf', 'token')
+    stream.conn = conn
+    stream.conn_lock = asyncio.Lock()
+    return stream
+
+
+class TestOmfRegistry:
+    """Unit tests for the OMF objects already created
+    """
+    @pytest.mark.asyncio
+    async def test_object_sent_once(self, mocker):
+        """A creation message is not sent again once the endpoint acknowledged it"""
+        sent = []
+
+        async def send(stream, message_type, omf_data):
+            sent.append(message_type)
+
+        mocker.patch.object(omf_translator, 'send_omf_message_to_end_point', side_effect=send)
+        stream = _connected_stream(MockConnection())
+
+        for _ in range(3):
+            await omf_translator.omf_object_send(stream, "Container", "measurement_mouse", "Container", [])
+
+        assert sent == ["Container"]
+        assert stream.created_objects == {("Container", "measurement_mouse")}
+
+    @pytest.mark.asyncio
+    async def test_reset(self, mocker):
+        """The objects of the producer token are deleted on the connection of the stream"""
+        mocker.patch.object(omf_translator, '_log')
+        conn = MockConnection()
+        stream = _connected_stream(conn)
+        stream.created_objects.add(("Container", "measurement_mouse"))
+
+        await omf_translator.omf_registry_reset(stream)
+
+        assert stream.created_objects == set()
+        assert conn.statements == [("DELETE FROM foglamp.omf_created_objects WHERE producer_token=%(token)s",
+                                    {'token': 'token'})]
+
+
+class MockResponse(object):
+    """An aiohttp response and its context manager"""
+    def __init__(self, status):
+        self.status = status
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        pass
+
+    async def text(self):
+        return ''
+
+
+class MockSession(object):
+    """An aiohttp session that answers every request with status"""
+    def __init__(self, status):
+        self._status = status
+
+    def post(self, url, **kwargs):
+        return MockResponse(self._status)
+
+
+class TestSendOmfMessageToEndPoint:
+    """Unit tests for send_omf_message_to_end_point
+    """
+    @pytest.mark.parametrize("readings_message, reset", [(True, True), (False, False)])
+    @pytest.mark.asyncio
+    async def test_reset(self, mocker, readings_message, reset):
+        """Only a rejected Data message of readings resets the OMF objects created"""
+        omf_registry_reset = mocker.patch.object(omf_translator, 'omf_registry_reset')
+        mocker.patch.object(omf_translator, '_LOG_SCREEN', False)
+        mocker.patch.object(omf_translator, '_log')
+        stream = omf_translator.OmfStream(1, 'http://localhost/omf', 'token')
+        stream.session = MockSession(400)
+        stream.send_semaphore = asyncio.Semaphore(1)
+
+        with pytest.raises(Exception):
+            await omf_translator.send_omf_message_to_end_point(stream, "Data", '[]', readings_message)
+
+        assert omf_registry_reset.called == reset
+
+
+
+
+class TestSendInfoToOmf:
+    """Unit tests for send_info_to_omf
+    """
+    @pytest.mark.asyncio
+    async def test_streaming(self, mocker):
+        """Blocks are sent until none is left and the position is checkpointed"""
+        Row = collections.namedtuple('Row', 'id')
+        blocks = {0: [Row(1), Row(2)], 2: [Row(3), Row(4)], 4: [Row(5)], 5: []}
+
+        async def read_block(conn, position):
+            return blocks[position]
+
+        sent = []
+
+        async def send_block(stream, rows):
+            sent.extend(row.id for row in rows)
+            return rows[-1].id, 1
+
+        mocker.patch.object(omf_translator, 'read_block', side_effect=read_block)
+        mocker.patch.object(omf_translator, 'send_block', side_effect=send_block)
+        mocker.patch.object(omf_translator, 'position_read', return_value=0)
+        position_update = mocker.patch.object(omf_translator, 'position_update')
+        mocker.patch.object(omf_translator, '_streaming', True)
+        mocker.patch.object(omf_translator, '_checkpoint_rows', 4)
+        mocker.patch.object(omf_translator, '_checkpoint_interval', 3600)
+        mocker.patch.object(omf_translator, '_LOG_SCREEN', False)
+        mocker.patch.object(omf_translator, '_log')
+
+        stream = omf_translator.OmfStream(7, 'http://localhost/omf', 'token')
+        await omf_translator.send_info_to_omf(stream)
+
+        assert sent == [1, 2, 3, 4, 5]
+        assert [call[0] for call in position_update.call_args_list] == [(stream, 4), (stream, 5)]
+
+    @pytest.mark.asyncio
+    async def test_partial(self, mocker):
+        """The position stops at the acknowledged rows of a partly sent block"""
+        Row = collections.namedtuple('Row', 'id')
+        blocks = {0: [Row(1), Row(2)], 2: [Row(3), Row(4), Row(5)]}
+
+        async def read_block(conn, position):
+            return blocks[position]
+
+        async def send_block(stream, rows):
+            return (rows[-1].id if rows[0].id == 1 else 3), 2
+
+        mocker.patch.object(omf_translator, 'read_block', side_effect=read_block)
+        mocker.patch.object(omf_translator, 'send_block', side_effect=send_block)
+        mocker.patch.object(omf_translator, 'position_read', return_value=0)
+        position_update = mocker.patch.object(omf_translator, 'position_update')
+        mocker.patch.object(omf_translator, '_streaming', True)
+        mocker.patch.object(omf_translator, '_LOG_SCREEN', False)
+        mocker.patch.object(omf_translator, '_log')
+
+        with pytest.raises(Exception):
+            await omf_translator.send_info_to_omf(omf_translator.OmfStream(7, '', ''))
+
+        assert position_update.call_args[0][1] == 3
+
+
+    @pytest.mark.asyncio
+    async def test_prefetch_before_release(self, mocker):
+        """The prefetched block is read before the connection goes back to the pool"""
+        Row = collections.namedtuple('Row', 'id')
+        events = []
+
+        async def read_block(conn, position):
+            if position:
+                await asyncio.sleep(0.01)
+                events.append('prefetched')
+                return []
+            return [Row(1), Row(2)]
+
+        class ReleasingEngine(MockEngine):
+            async def __aexit__(self, exc_type, exc_val, exc_tb):
+                events.append('released')
+
+        mocker.patch.object(omf_translator, 'read_block', side_effect=read_block)
+        mocker.patch.object(omf_translator, 'send_block', side_effect=Exception("relay unavailable"))
+        mocker.patch.object(omf_translator, 'position_read', return_value=0)
+        mocker.patch.object(omf_translator, 'position_update')
+        mocker.patch.object(omf_translator, 'omf_session_open')
+        mocker.patch.object(omf_translator, 'omf_session_close')
+        mocker.patch.object(omf_translator, 'omf_registry_load')
+        mocker.patch.object(omf_translator, 'omf_types_creation')
+        mocker.patch.object(omf_translator, '_streaming', True)
+        mocker.patch.object(omf_translator, '_LOG_SCREEN', False)
+        mocker.patch.object(omf_translator, '_log')
+
+        with pytest.raises(Exception):
+            await omf_translator.send_stream(omf_translator.OmfStream(7, '', ''), ReleasingEngine())
+
+        assert events == ['prefetched', 'released']
+
+
+class TestMain:
+    """Unit tests for main
+    """
+    @pytest.mark.asyncio
+    async def test_streams(self, mocker):
+        """Every stream is sent at the same time and a failed stream does not stop the others"""
+        streams = [omf_translator.OmfStream(stream_id, 'http://localhost/omf', 'token') for stream_id in (1, 2, 3)]
+        started = []
+        completed = []
+
+        async def send_stream(stream, engine):
+            started.append(stream.id)
+            await asyncio.sleep(0)
+            # Every stream has started before any completes
+            assert len(started) == len(streams)
+            if stream.id == 2:
+                raise Exception("endpoint down")
+            completed.append(stream.id)
+
+        mocker.patch.object(omf_translator.psycopg2.extras, 'register_default_jsonb')
+        mocker.patch.object(omf_translator.aiopg.sa, 'create_engine', return_value=MockEngine())
+        mocker.patch.object(omf_translator, 'streams_read', return_value=streams)
+        mocker.patch.object(omf_translator, 'send_stream', side_effect=send_stream)
+        mocker.patch.object(omf_translator, '_LOG_SCREEN', False)
+        mocker.patch.object(omf_translator, '_log')
+
+        with pytest.raises(Exception) as excinfo:
+            await omf_translator.main()
+
+        assert completed == [1, 3]
+        assert "[2]" in str(excinfo.value)
+
+
+class TestDebugMsgWrite:
+    """Unit tests for debug_msg_write
+    """
+    def test_disabled(self, mocker):
+        """Nothing is formatted when debug messages are neither printed nor logged"""
+        log = mocker.patch.object(omf_translator, '_log')
+        log.isEnabledFor.return_value = False
+        mocker.patch.object(omf_translator, '_LOG_SCREEN', False)
+        template = mocker.MagicMock()
+
+        omf_translator.debug_msg_write("INFO", template, {'x': 1})
+
+        assert not template.format.called
+        assert not log.debug.called
+
+
+class TestCreateValueExtractor:
+    """Unit tests for create_value_extractor
+    """
+    def test_extract(self):
+        """Only the properties of the dynamic definition are extracted"""
+        definition = [
+            {"id": "static", "type": "object", "classification": "static",
+             "properties": {"Name": {"type": "string", "isindex": True}}},
+            {"id": "dynamic", "type": "object", "classification": "dynamic",
+             "properties": {"Time": {"format": "date-time", "type": "string", "isindex": True},
+                            "x": {"type": "number"}, "y": {"type": "number"}}}
+        ]
+        Row = collections.namedtuple('Row', 'user_ts reading')
+        extract_values = omf_translator.create_value_extractor(definition)
+
+        values = extract_values(Row(datetime.datetime(2017, 1, 1), {'x': 1, 'lux': 2}))
+
+        assert values == {'Time': '2017-01-01T00:00:00', 'x': 1}
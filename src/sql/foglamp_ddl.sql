@@ -552,6 +552,30 @@ CREATE INDEX fki_streams_fk1
     ON foglamp.streams USING btree (destination_id)
     TABLESPACE foglamp;
 
+-- Lets the purge read the lowest last_object of the active streams
+CREATE INDEX streams_ix1
+    ON foglamp.streams USING btree (last_object)
+    TABLESPACE foglamp
+    WHERE active;
+
+
+-- OMF objects already created on an OMF endpoint
+-- Lets the OMF translator send the Type, Container, static Data and link
+-- messages of an asset once instead of with every reading.
+CREATE TABLE foglamp.omf_created_objects (
+       producer_token character varying(255)      NOT NULL,               -- The producer token of the endpoint
+       object_type    character varying(20)       NOT NULL,               -- Type, Container, Static or Link
+       object_id      character varying(255)      NOT NULL,               -- The OMF type id, container id or asset code
+       ts             timestamp(6) with time zone NOT NULL DEFAULT now(), -- When the endpoint accepted the object
+       CONSTRAINT omf_created_objects_pkey PRIMARY KEY (producer_token, object_type, object_id)
+            USING INDEX TABLESPACE foglamp )
+  WITH ( OIDS = FALSE )
+  TABLESPACE foglamp;
+
+ALTER TABLE foglamp.omf_created_objects OWNER to foglamp;
+COMMENT ON TABLE foglamp.omf_created_objects IS
+'OMF objects that the OMF endpoint of a producer token already acknowledged.';
+
 
 -- Configuration table
 -- The configuration in JSON format.
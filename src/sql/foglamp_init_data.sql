@@ -50,8 +50,10 @@ DELETE FROM foglamp.configuration;
 
 -- LOGPR: Log Partitioning
 --        unit: unit used for partitioning. Valid values are minute, half-hour, hour, 6-hour, half-day, day, week, fortnight, month. Default is day
+--              The partitions of the readings table (see foglamp_readings_partitioning.sql) support hour and day.
+--        premake: number of future partitions of the readings table created in advance. Default is 3
 INSERT INTO foglamp.configuration ( key, description, value )
-     VALUES ( 'LOGPART', 'Log Partitioning', '{ "unit" : "day" }' );
+     VALUES ( 'LOGPART', 'Log Partitioning', '{ "unit" : "day", "premake" : 3 }' );
 
 -- SENSR: Sensors and devices
 --        status      : the process is on or off, it is on by default
@@ -116,6 +118,7 @@ INSERT INTO foglamp.statistics ( key, description, value )
 
 insert into foglamp.scheduled_processes (name, script) values ('device', '["python3", "-m", "foglamp.device"]');
 insert into foglamp.scheduled_processes (name, script) values ('purge', '["python3", "-m", "foglamp.data_purge"]');
+insert into foglamp.scheduled_processes (name, script) values ('partitions', '["python3", "-m", "foglamp.data_purge.partitions"]');
 
 -- Start the device server at start-up
 insert into foglamp.schedules(id, schedule_name, process_name, schedule_type,
@@ -129,3 +132,9 @@ schedule_time, schedule_interval, exclusive)
 values ('cea17db8-6ccc-11e7-907b-a6006ad3dba0', 'purge', 'purge', 3,
 '20:00:00', '00:00:30', true);
 
+-- Create the coming partitions of the readings table every hour
+insert into foglamp.schedules(id, schedule_name, process_name, schedule_type,
+schedule_interval, exclusive)
+values ('32bfea4c-cb22-11f1-b3f7-02fc00000001', 'partitions', 'partitions', 3,
+'01:00:00', true);
+
@@ -0,0 +1,110 @@
+----------------------------------------------------------------------
+-- Copyright (c) 2017 OSIsoft, LLC
+--
+-- Licensed under the Apache License, Version 2.0 (the "License");
+-- you may not use this file except in compliance with the License.
+-- You may obtain a copy of the License at
+--
+--     http://www.apache.org/licenses/LICENSE-2.0
+--
+-- Unless required by applicable law or agreed to in writing, software
+-- distributed under the License is distributed on an "AS IS" BASIS,
+-- WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+-- See the License for the specific language governing permissions and
+-- limitations under the License.
+----------------------------------------------------------------------
+
+--
+-- foglamp_readings_partitioning.sql
+--
+-- PostgreSQL script to partition foglamp.readings by ranges of ts.
+-- Requires PostgreSQL 11 or later.
+--
+-- The purge process retires expired readings by dropping whole
+-- partitions instead of deleting rows. The scheduled process
+-- 'partitions' (foglamp.data_purge.partitions) creates the partitions
+-- of the coming LOGPART periods.
+--
+-- The readings already stored become the partition readings_legacy,
+-- which holds every ts up to the end of the current hour. It is
+-- dropped once it has expired as a whole. The partitions that follow,
+-- up to the end of the next UTC day, are created here as well, so
+-- inserts never lack a partition before 'partitions' first runs.
+--
+-- read_key is unique within each partition only, see the partitions.
+--
+
+-- NOTE:
+-- This script must be launched with:
+-- PGPASSWORD=foglamp psql -U foglamp -h localhost -f foglamp_readings_partitioning.sql foglamp
+-- and followed, before the end of the next UTC day, by:
+-- python3 -m foglamp.data_purge.partitions
+
+
+BEGIN;
+
+ALTER TABLE foglamp.readings RENAME TO readings_legacy;
+ALTER TABLE foglamp.readings_legacy RENAME CONSTRAINT readings_pkey TO readings_legacy_pkey;
+ALTER INDEX foglamp.fki_readings_fk1 RENAME TO readings_legacy_fk1;
+ALTER INDEX foglamp.readings_ix1 RENAME TO readings_legacy_ix1;
+
+-- A partitioned table can only have unique keys that contain ts
+CREATE TABLE foglamp.readings (
+    id         bigint                      NOT NULL DEFAULT nextval('foglamp.readings_id_seq'::regclass),
+    asset_code character varying(50)       NOT NULL,                      -- The provided asset code. Not necessarily located in the
+                                                                          -- assets table.
+    read_key   uuid,                                                      -- An optional key used to avoid double-loading, unique in each partition.
+    reading    jsonb                       NOT NULL DEFAULT '{}'::jsonb,  -- The json object received
+    user_ts    timestamp(6) with time zone NOT NULL DEFAULT now(),        -- The user timestamp extracted by the received message
+    ts         timestamp(6) with time zone NOT NULL DEFAULT now(),
+    CONSTRAINT readings_pkey PRIMARY KEY (id, ts)
+  )
+  PARTITION BY RANGE (ts);
+
+ALTER TABLE foglamp.readings OWNER to foglamp;
+COMMENT ON TABLE foglamp.readings IS
+'Readings from sensors and devices, partitioned by ranges of ts.';
+
+CREATE INDEX fki_readings_fk1
+    ON foglamp.readings USING btree (asset_code);
+
+CREATE INDEX readings_ix1
+    ON foglamp.readings USING btree (read_key);
+
+-- Matches the primary key of the partitioned table so the indexes are attached
+CREATE UNIQUE INDEX readings_legacy_id_ts
+    ON foglamp.readings_legacy USING btree (id, ts)
+    TABLESPACE foglamp;
+
+DO $$
+DECLARE
+    legacy_end     timestamptz := date_trunc('hour', now() AT TIME ZONE 'UTC') AT TIME ZONE 'UTC' + interval '1 hour';
+    next_day       timestamptz := date_trunc('day', now() AT TIME ZONE 'UTC') AT TIME ZONE 'UTC' + interval '1 day';
+    bounds         timestamptz[];
+    partition_name text;
+BEGIN
+    EXECUTE format('ALTER TABLE foglamp.readings ATTACH PARTITION foglamp.readings_legacy '
+                   'FOR VALUES FROM (MINVALUE) TO (%L)', legacy_end);
+
+    -- Up to the next UTC midnight, then the next UTC day, named like
+    -- foglamp.data_purge.partitions names them
+    bounds := ARRAY[legacy_end];
+    IF next_day > legacy_end THEN
+        bounds := bounds || next_day;
+    END IF;
+    bounds := bounds || (next_day + interval '1 day');
+
+    FOR i IN 1 .. array_length(bounds, 1) - 1 LOOP
+        partition_name := 'readings_' || to_char(bounds[i] AT TIME ZONE 'UTC', 'YYYYMMDDHH24');
+
+        EXECUTE format('CREATE TABLE foglamp.%I PARTITION OF foglamp.readings '
+                       'FOR VALUES FROM (%L) TO (%L) TABLESPACE foglamp', partition_name, bounds[i], bounds[i + 1]);
+        -- read_key can only be unique within a partition
+        EXECUTE format('CREATE UNIQUE INDEX %I ON foglamp.%I USING btree (read_key) TABLESPACE foglamp',
+                       partition_name || '_read_key', partition_name);
+        EXECUTE format('ALTER TABLE foglamp.%I OWNER TO foglamp', partition_name);
+    END LOOP;
+END
+$$;
+
+COMMIT;